@@ -0,0 +1,172 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import simulation
+
+# Per-process state of a pool worker: the shared map blocks it attached to
+# and the worlds built on top of them.
+_worker_maps = {}
+_worker_worlds = {}
+
+
+def map_ids(image_patterns=(), maze_seeds=(), maze_algorithm=None):
+    ids = []
+    for pattern in image_patterns:
+        ids.extend(sorted(glob.glob(pattern)) or [pattern])
+    prefix = simulation.MAZE_PREFIX + (f'{maze_algorithm}:' if maze_algorithm else '')
+    ids.extend(f'{prefix}{seed}' for seed in maze_seeds)
+    return ids
+
+
+class SharedMaps:
+    # The preprocessed grid and clearance map of every world, each copied
+    # once into a shared memory block. Workers map the blocks instead of
+    # receiving a pickled copy of every array.
+
+    def __init__(self, worlds):
+        self.blocks = []
+        self.specs = {}
+        for map_id, world in worlds.items():
+            self.specs[map_id] = {
+                'grid': self._share(world.grid),
+                'clearance': self._share(world.clearance),
+                'spawn_bounds': world.spawn_bounds,
+            }
+
+    def _share(self, array):
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        self.blocks.append(block)
+        return block.name, array.shape, array.dtype.str
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    # The parent owns the block and unlinks it; a worker only maps it. Pool
+    # workers share the parent's resource tracker, so on Pythons without
+    # `track` the extra registration is harmless.
+    try:
+        block = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        block = shared_memory.SharedMemory(name=name)
+    _worker_maps[name] = block
+    return np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+
+
+def _init_worker(specs):
+    _worker_maps.clear()
+    _worker_worlds.clear()
+    for map_id, spec in specs.items():
+        _worker_worlds[map_id] = simulation.World(_attach(spec['grid']), spec['spawn_bounds'],
+                                                  clearance=_attach(spec['clearance']))
+
+
+def _run(task):
+    map_id, seed, max_ticks = task
+    result = simulation.run_episode(_worker_worlds[map_id], seed=seed, max_ticks=max_ticks)
+    result['map'] = map_id
+    return result
+
+
+class Metrics:
+    # Running totals of episode results, cheap to update and to report at
+    # any point while a batch is still streaming in.
+
+    def __init__(self):
+        self.episodes = 0
+        self.crashes = 0
+        self.returned = 0
+        self.landing_battery = 0.0
+        self.path_length = 0.0
+        self.ticks = 0
+
+    def add(self, result):
+        self.episodes += 1
+        self.crashes += result['crashed']
+        self.ticks += result['ticks']
+        self.path_length += result['path_length_px']
+        if result['returned_home']:
+            self.returned += 1
+            self.landing_battery += result['battery']
+
+    def summary(self):
+        episodes = self.episodes or 1
+        return {
+            'episodes': self.episodes,
+            'crash_rate': self.crashes / episodes,
+            'return_home_rate': self.returned / episodes,
+            'mean_landing_battery': self.landing_battery / self.returned if self.returned else None,
+            'mean_path_length_px': self.path_length / episodes,
+            'ticks': self.ticks,
+        }
+
+
+def run_batch(maps, episodes, seed=0, workers=None, max_ticks=100000, report_every=100):
+    # Runs `episodes` episodes on every map, seeded seed, seed + 1, ... per
+    # map, across a process pool. Yields a report of the aggregated metrics
+    # every report_every finished episodes and a final one at the end.
+    worlds = {map_id: simulation.World.from_id(map_id) for map_id in maps}
+    tasks = [(map_id, seed + episode, max_ticks) for episode in range(episodes) for map_id in maps]
+    workers = workers or os.cpu_count() or 1
+    per_map = {map_id: Metrics() for map_id in maps}
+    overall = Metrics()
+
+    def report(done):
+        return {
+            'done': done,
+            'total': len(tasks),
+            'overall': overall.summary(),
+            'maps': {map_id: metrics.summary() for map_id, metrics in per_map.items()},
+        }
+
+    with SharedMaps(worlds) as shared:
+        with multiprocessing.Pool(workers, _init_worker, (shared.specs,)) as pool:
+            chunksize = max(1, len(tasks) // (workers * 16))
+            for done, result in enumerate(pool.imap_unordered(_run, tasks, chunksize), 1):
+                per_map[result['map']].add(result)
+                overall.add(result)
+                if report_every and done % report_every == 0 and done < len(tasks):
+                    yield report(done)
+        yield report(len(tasks))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run headless episodes over many maps and seeds in parallel.")
+    parser.add_argument('images', nargs='*', default=[os.path.join('Maps', 'p1*.png')],
+                        help="map images or glob patterns (default: Maps/p1*.png)")
+    parser.add_argument('--mazes', type=int, default=0, help="also run on this many generated mazes")
+    parser.add_argument('--maze-algorithm', default=None,
+                        help="backtracker, kruskal, prim or cellular (default: backtracker)")
+    parser.add_argument('--episodes', type=int, default=100, help="episodes per map")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-ticks', type=int, default=100000)
+    parser.add_argument('--report-every', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    maps = map_ids(args.images, range(args.seed, args.seed + args.mazes), args.maze_algorithm)
+    for report in run_batch(maps, args.episodes, args.seed, args.workers, args.max_ticks, args.report_every):
+        print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import map_cache
+import mazes
+import occupancy
+import path_buffer
+import planner
+import simulation
+import swarm
+
+FORMAT_VERSION = 1
+MAZE_IDS = ('maze:0', 'maze:kruskal:1', 'maze:cellular:2')
+PATH_LENGTHS = (1000, 10000, 100000)
+PATH_MAP = 'maze:kruskal:1'
+# Tolerance the flown paths are decimated to before plan_retrace times planning along them.
+PATH_DECIMATION_PX = 1.0
+# Maze side in cells each algorithm is timed at: the vectorised ones at
+# the 4000x4000 size test worlds are mass-produced at, the backtracker,
+# which walks cell by cell in Python, at 1000x1000.
+MAZE_SIZES = {'backtracker': 1000, 'kruskal': 4000, 'prim': 4000, 'cellular': 4000}
+QUICK_MAZE_SIZE = 500
+SWARM_DRONES = 1000
+SWARM_TICKS = 20
+# A stage counts as a regression when it is this much slower than its
+# baseline.
+REGRESSION_RATIO = 1.25
+
+
+def measure(function, repeat=5, ops=1, unit='call'):
+    # Best and median wall time of `repeat` calls, the rate of `ops` units of
+    # work per call at the best time, and the peak memory traced during one
+    # extra call (kept separate so tracing does not slow the timed calls).
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    best = min(times)
+    return {
+        'seconds': best,
+        'median_seconds': statistics.median(times),
+        'per_second': ops / best if best else None,
+        'unit': unit,
+        'peak_kb': peak / 1024,
+    }
+
+
+def flight_path(world, length, seed=0, radius=simulation.DRONE_RADIUS_PX, turn_probability=0.02):
+    # A reproducible flown path of `length` points: one pixel per step along
+    # the axes, through free space only, turning at random and at walls.
+    # Long paths loop over the same corridors the way long flights do.
+    rng = random.Random(seed)
+    mask, pad = world.free_mask(radius)
+    height, width = world.grid.shape
+
+    def free(x, y):
+        return 0 <= x < width and 0 <= y < height and bool(mask[y + pad, x + pad])
+
+    x, y = world.spawn_positions(1, radius, rng)[0]
+    headings = ((1, 0), (-1, 0), (0, 1), (0, -1))
+    dx, dy = rng.choice(headings)
+    points = np.empty((length, 2), dtype=np.int32)
+    for i in range(length):
+        points[i] = x, y
+        if rng.random() < turn_probability or not free(x + dx, y + dy):
+            dx, dy = rng.choice([(hx, hy) for hx, hy in headings if free(x + hx, y + hy)])
+        x, y = x + dx, y + dy
+    return points
+
+
+def map_stages(map_id, repeat):
+    results = {}
+    if not map_id.startswith(simulation.MAZE_PREFIX):
+        results['load_grid'] = measure(lambda: occupancy.load_occupancy_grid(map_id), repeat, unit='map')
+        with tempfile.TemporaryDirectory() as directory:
+            map_cache.load_grid(map_id, directory=directory)
+            results['load_grid_cached'] = measure(lambda: map_cache.load_grid(map_id, directory=directory), repeat,
+                                                  unit='map')
+    else:
+        results['generate_maze'] = measure(lambda: simulation.World.from_id(map_id).grid, repeat, unit='map')
+
+    world = simulation.World.from_id(map_id)
+    radius = simulation.DRONE_RADIUS_PX
+    results['clearance_map'] = measure(lambda: occupancy.clearance_map(world.grid), repeat, unit='map')
+    rng = random.Random(0)
+    results['spawn'] = measure(lambda: world.spawn_positions(1, radius, rng), repeat, unit='spawn')
+
+    height, width = world.grid.shape
+    points = np.random.default_rng(0).uniform((0, 0), (width, height), (1000, 2)).tolist()
+    results['footprint_collides'] = measure(
+        lambda: [occupancy.footprint_collides(world.grid, x, y, radius) for x, y in points], repeat,
+        len(points), 'check')
+    free = world.free_mask(radius)
+    segments = [(x, y, x + 6, y + 3) for x, y in points]
+    results['sweep'] = measure(lambda: [occupancy.sweep(free, *segment) for segment in segments], repeat,
+                               len(segments), 'check')
+
+    home = world.spawn_positions(1, radius, random.Random(1))[0]
+    results['home_field'] = measure(lambda: planner.HomeField(world.grid, home, radius), repeat, unit='field')
+    results['sensors'] = measure(lambda: [world.sensors.read(x, y, 0) for x, y in points[:100]], repeat, 100,
+                                 'read')
+
+    def episodes():
+        return sum(simulation.run_episode(world, seed=seed)['ticks'] for seed in range(5))
+
+    results['episode'] = measure(episodes, repeat, episodes(), 'tick')
+
+    def swarm_ticks():
+        # A fresh swarm every call, so every call times drones in flight.
+        flock = swarm.Swarm(world, SWARM_DRONES, rng=random.Random(0))
+        controller = swarm.random_walk(flock, np.random.default_rng(0))
+        for _ in range(SWARM_TICKS):
+            flock.step(*controller(flock))
+
+    results['swarm'] = measure(swarm_ticks, repeat, SWARM_DRONES * SWARM_TICKS, 'drone tick')
+
+    frame = render_stage(world, repeat)
+    if frame is not None:
+        results['frame'] = frame
+    return results
+
+
+def render_stage(world, repeat):
+    # One frame of the pygame games: restore, draw a drone and a stretch of
+    # trail, update the dirty areas. Skipped when pygame is missing.
+    try:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        import pygame
+
+        import rendering
+    except ImportError:
+        return None
+    pygame.display.init()
+    try:
+        height, width = world.grid.shape
+        screen = pygame.display.set_mode((width, height))
+        renderer = rendering.MapRenderer(screen, world.grid, walls=world.walls)
+        renderer.begin_frame()
+        renderer.end_frame()
+        x, y = world.spawn_positions(1, simulation.DRONE_RADIUS_PX, random.Random(0))[0]
+
+        def frame():
+            renderer.begin_frame()
+            renderer.mark(renderer.draw_trail([(x, y), (x + 1, y)], rendering.BLACK, 2),
+                          pygame.draw.circle(screen, (0, 0, 255), (x, y), simulation.DRONE_RADIUS_PX))
+            renderer.end_frame()
+
+        return measure(frame, repeat * 20, unit='frame')
+    finally:
+        pygame.display.quit()
+
+
+def path_stages(length, repeat):
+    world = simulation.World.from_id(PATH_MAP)
+    points = flight_path(world, length)
+    results = {}
+
+    def append():
+        buffer = path_buffer.PathBuffer()
+        for x, y in points.tolist():
+            buffer.append(x, y)
+
+    results['path_append'] = measure(append, repeat, length, 'point')
+    results['decimate'] = measure(lambda: path_buffer.douglas_peucker(points, PATH_DECIMATION_PX),
+                                  repeat, length, 'point')
+    flown = path_buffer.douglas_peucker(points, PATH_DECIMATION_PX)
+    start, goal = tuple(points[-1]), tuple(points[0])
+    radius = simulation.DRONE_RADIUS_PX
+    results['plan_retrace'] = measure(
+        lambda: planner.plan_path(world.grid, start, goal, radius, mode='retrace', flown_path=flown), repeat,
+        unit='plan')
+    results['plan_shortest'] = measure(lambda: planner.plan_path(world.grid, start, goal, radius), repeat,
+                                       unit='plan')
+    return results
+
+
+def maze_stages(sizes, repeat):
+    # Generation time of a size x size maze per algorithm, as cells per
+    # second.
+    results = {}
+    for algorithm, size in sizes.items():
+        results[f'{algorithm}:{size}'] = measure(lambda: mazes.maze_cells(size, size, algorithm, seed=0), repeat,
+                                                 size * size, 'cell')
+    return results
+
+
+def run(map_ids, path_lengths=PATH_LENGTHS, repeat=5, maze_sizes=MAZE_SIZES):
+    fixtures = {}
+    if maze_sizes:
+        fixtures['mazes'] = maze_stages(maze_sizes, repeat)
+    for map_id in map_ids:
+        fixtures[map_id] = map_stages(map_id, repeat)
+    for length in path_lengths:
+        fixtures[f'path:{length}'] = path_stages(length, repeat)
+    return {
+        'version': FORMAT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'fixtures': fixtures,
+    }
+
+
+def compare(report, baseline, threshold=REGRESSION_RATIO):
+    # Time ratio against the baseline for every stage both reports have,
+    # and the stages that got slower than the threshold allows.
+    ratios = {}
+    regressions = []
+    for fixture, stages in report['fixtures'].items():
+        for stage, result in stages.items():
+            before = baseline['fixtures'].get(fixture, {}).get(stage)
+            if not before or not before['seconds']:
+                continue
+            ratio = result['seconds'] / before['seconds']
+            ratios[f'{fixture} {stage}'] = ratio
+            if ratio > threshold:
+                regressions.append(f'{fixture} {stage}')
+    return ratios, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the simulation's hot paths on fixed maps, mazes and paths.")
+    parser.add_argument('images', nargs='*', default=[os.path.join('Maps', 'p1*.png')],
+                        help="map images or glob patterns (default: Maps/p1*.png)")
+    parser.add_argument('--repeat', type=int, default=5, help="timed calls per stage; the best one counts")
+    parser.add_argument('--quick', action='store_true',
+                        help="one maze, no images, paths up to 10k points, 500x500 generated mazes")
+    parser.add_argument('--save', metavar='JSON', help="write the results as a baseline")
+    parser.add_argument('--compare', metavar='JSON', help="compare against a saved baseline")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_RATIO,
+                        help="slowdown ratio that counts as a regression (default: 1.25)")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        map_ids, lengths = MAZE_IDS[:1], PATH_LENGTHS[:2]
+        maze_sizes = dict.fromkeys(MAZE_SIZES, QUICK_MAZE_SIZE)
+    else:
+        map_ids = [path for pattern in args.images for path in sorted(glob.glob(pattern)) or [pattern]]
+        map_ids += list(MAZE_IDS)
+        lengths = PATH_LENGTHS
+        maze_sizes = MAZE_SIZES
+    report = run(map_ids, lengths, args.repeat, maze_sizes)
+
+    for fixture, stages in report['fixtures'].items():
+        for stage, result in stages.items():
+            rate = f"{result['per_second']:.1f} {result['unit']}/s" if result['per_second'] else '-'
+            print(f"{fixture:<24} {stage:<20} {result['seconds'] * 1e3:10.3f} ms {rate:>22} "
+                  f"{result['peak_kb']:10.0f} KB")
+
+    if args.save:
+        directory = os.path.dirname(args.save)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        ratios, regressions = compare(report, baseline, args.threshold)
+        for name, ratio in ratios.items():
+            print(f"{name:<45} {ratio:6.2f}x{'  REGRESSION' if name in regressions else ''}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
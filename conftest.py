@@ -0,0 +1,12 @@
+import pytest
+
+# The modules are flat files at the top of the repository; pytest puts this
+# directory on sys.path because this conftest lives here.
+
+
+@pytest.fixture(autouse=True)
+def _scratch_dirs(tmp_path, monkeypatch):
+    # Keep map caches, recordings, telemetry and profiles out of the tree.
+    monkeypatch.setenv('DRONE_MAP_CACHE', str(tmp_path / 'map_cache'))
+    for name in ('DRONE_RECORD_DIR', 'DRONE_TELEMETRY_DIR', 'DRONE_PROFILE_DIR', 'DRONE_PROFILE'):
+        monkeypatch.delenv(name, raising=False)
@@ -0,0 +1,422 @@
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import math
+import random
+import socket
+
+import numpy as np
+
+import simulation
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Telemetry frames a session may have waiting for a slow client; older ones
+# are dropped first, since a controller only needs the newest.
+OUTBOX_FRAMES = 8
+# A drone whose controller has gone quiet for this long hovers.
+COMMAND_TIMEOUT_TICKS = simulation.TICK_RATE // 2
+MAX_DRONES_PER_SESSION = 1024
+LINE_LIMIT = 1 << 20  # longest request line, in bytes
+# Maps kept loaded for new spawns; the least recently used is dropped first.
+# Drones already flying keep their own world.
+WORLD_CACHE_SIZE = 16
+ACTIVE = (simulation.FLYING, simulation.RETURNING)
+FAILED = 'failed'  # the simulation raised on this drone; only its flight ends
+
+# The protocol is newline-delimited JSON both ways. Requests:
+#   {"op": "spawn", "ref": 1, "map": "maze:0", "seed": 7}
+#   {"op": "command", "commands": [{"drone": 0, "vx": 3, "vy": 0, "yaw": 90}, ...]}
+#   {"op": "despawn", "ref": 2, "drone": 0}
+# Replies carry the request's ref: {"op": "spawned", "ref": 1, "drone": 0,
+# "x": ..., "y": ...}, {"op": "despawned", ...} or {"op": "error", "ref": ...,
+# "error": "..."}. Every SENSOR_PERIOD_TICKS each session gets one frame for
+# all its drones: {"op": "telemetry", "tick": ..., "time": ..., "drones":
+# [{"drone": 0, "state": "flying", "x": ..., "y": ..., "distance": [...],
+# "yaw": ..., "Vx": ..., "Vy": ..., "bat": ..., "pitch": ..., "roll": ...}]}.
+# A drone the simulation failed on reports state "failed" and an "error".
+
+
+def finite(value, name):
+    # A command number as a float; strings, NaN and infinities are refused
+    # here rather than by the tick loop.
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{name} must be finite, not {value!r}")
+    return number
+
+
+class Flight:
+    __slots__ = ('world', 'drone', 'state', 'command', 'commanded_at', 'error')
+
+    def __init__(self, world, drone, tick):
+        self.world = world
+        self.drone = drone
+        self.state = simulation.FLYING
+        self.command = simulation.HOVER
+        self.commanded_at = tick
+        self.error = None
+
+    def fail(self, error):
+        self.state = FAILED
+        self.error = f"{type(error).__name__}: {error}"
+
+
+class Session:
+    # One connection: the drones it spawned, the latest command for each and
+    # the frames waiting to be written. Replies are always kept; telemetry is
+    # a bounded deque, so a client that reads slower than the sensor rate
+    # loses its oldest frames instead of slowing the simulation down.
+
+    def __init__(self, reader, writer, outbox_frames=OUTBOX_FRAMES):
+        self.reader = reader
+        self.writer = writer
+        self.flights = {}
+        self.replies = collections.deque()
+        self.telemetry = collections.deque(maxlen=outbox_frames)
+        self.pending = asyncio.Event()
+        self.dropped = 0
+        self.closed = False
+
+    def reply(self, message):
+        self.replies.append(message)
+        self.pending.set()
+
+    def push_telemetry(self, frame):
+        if len(self.telemetry) == self.telemetry.maxlen:
+            self.dropped += 1
+        self.telemetry.append(frame)
+        self.pending.set()
+
+    async def write_loop(self):
+        # Only this task waits on the client; drain() blocks it, never the
+        # tick loop.
+        while not self.closed:
+            await self.pending.wait()
+            self.pending.clear()
+            while self.replies or self.telemetry:
+                message = self.replies.popleft() if self.replies else self.telemetry.popleft()
+                self.writer.write(json.dumps(message).encode() + b'\n')
+                await self.writer.drain()
+
+
+class ControlServer:
+    # Runs the simulation at a fixed tick for every connected session and
+    # lets external controllers fly drones over TCP or Unix sockets, or over
+    # a loopback socket pair in the same process. Each tick steps every
+    # live drone with its latest command; the commands and telemetry only
+    # pass through per-session buffers, so the tick never waits on a socket.
+    #
+    # Worlds are loaded once per map id and shared by every drone on them.
+    # Loading a map and spawning (which builds the drone's home field) run
+    # in the default executor, off the tick loop. With speed=0 the loop
+    # ticks as fast as it can instead of in real time.
+
+    def __init__(self, speed=1.0, dt=simulation.FIXED_DT, drone_class=simulation.Drone,
+                 command_timeout=COMMAND_TIMEOUT_TICKS, outbox_frames=OUTBOX_FRAMES,
+                 world_cache_size=WORLD_CACHE_SIZE):
+        self.speed = speed
+        self.dt = dt
+        self.drone_class = drone_class
+        self.command_timeout = command_timeout
+        self.outbox_frames = outbox_frames
+        self.tick = 0
+        self.sessions = set()
+        self.worlds = collections.OrderedDict()
+        self.world_cache_size = world_cache_size
+        # The event loop only keeps weak references to tasks.
+        self.handlers = set()
+        self.drone_ids = itertools.count()
+
+    async def serve_tcp(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        return await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT)
+
+    async def serve_unix(self, path):
+        return await asyncio.start_unix_server(self.handle, path, limit=LINE_LIMIT)
+
+    async def loopback(self):
+        # A client connected to this server over a socket pair, for tests and
+        # controllers that live in the same process.
+        server_socket, client_socket = socket.socketpair()
+        reader, writer = await asyncio.open_connection(sock=server_socket, limit=LINE_LIMIT)
+        handler = asyncio.ensure_future(self.handle(reader, writer))
+        self.handlers.add(handler)
+        handler.add_done_callback(self.handlers.discard)
+        reader, writer = await asyncio.open_connection(sock=client_socket, limit=LINE_LIMIT)
+        return ControlClient(reader, writer)
+
+    async def handle(self, reader, writer):
+        session = Session(reader, writer, self.outbox_frames)
+        self.sessions.add(session)
+        writing = asyncio.ensure_future(session.write_loop())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    session.reply({'op': 'error', 'error': 'not a JSON line'})
+                    continue
+                await self.dispatch(session, request)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError, asyncio.CancelledError):
+            # Disconnects, oversized lines and server shutdown all just end
+            # the session.
+            pass
+        finally:
+            session.closed = True
+            self.sessions.discard(session)
+            writing.cancel()
+            writer.close()
+
+    async def dispatch(self, session, request):
+        if not isinstance(request, dict):
+            session.reply({'op': 'error', 'error': f"request must be a JSON object, not {type(request).__name__}"})
+            return
+        op = request.get('op')
+        ref = request.get('ref')
+        try:
+            if op == 'command':
+                self.apply_commands(session, request.get('commands', [request]))
+            elif op == 'spawn':
+                session.reply(dict(await self.spawn(session, request.get('map', 'maze:0'), request.get('seed')),
+                                   op='spawned', ref=ref))
+            elif op == 'despawn':
+                drone = request['drone']
+                if not isinstance(drone, int):
+                    raise TypeError(f"drone must be an integer, not {type(drone).__name__}")
+                session.flights.pop(drone, None)
+                session.reply({'op': 'despawned', 'ref': ref, 'drone': drone})
+            else:
+                raise ValueError(f"unknown op {op!r}")
+        except (KeyError, TypeError, ValueError, OSError) as error:
+            session.reply({'op': 'error', 'ref': ref, 'error': f"{type(error).__name__}: {error}"})
+
+    def apply_commands(self, session, commands):
+        # Commands are held until replaced, like a key held down, so a batch
+        # costs a dict update per drone whenever it arrives.
+        for command in commands:
+            flight = session.flights.get(command['drone'])
+            if flight is None:
+                raise KeyError(f"no drone {command['drone']} in this session")
+            yaw = command.get('yaw')
+            flight.command = simulation.Command(finite(command.get('vx', 0), 'vx'),
+                                                finite(command.get('vy', 0), 'vy'),
+                                                None if yaw is None else finite(yaw, 'yaw'))
+            flight.commanded_at = self.tick
+
+    async def world(self, map_id):
+        if not isinstance(map_id, str):
+            raise TypeError(f"map must be a string, not {type(map_id).__name__}")
+        loop = asyncio.get_running_loop()
+        if map_id in self.worlds:
+            self.worlds.move_to_end(map_id)
+        else:
+            self.worlds[map_id] = loop.run_in_executor(None, simulation.World.from_id, map_id)
+            while len(self.worlds) > self.world_cache_size:
+                self.worlds.popitem(last=False)
+        loading = self.worlds[map_id]
+        try:
+            return await asyncio.shield(loading)
+        except Exception:
+            if self.worlds.get(map_id) is loading:
+                del self.worlds[map_id]
+            raise
+
+    async def spawn(self, session, map_id, seed=None):
+        if len(session.flights) >= MAX_DRONES_PER_SESSION:
+            raise ValueError(f"at most {MAX_DRONES_PER_SESSION} drones per session")
+        world = await self.world(map_id)
+        rng = random.Random(seed)
+        drone = await asyncio.get_running_loop().run_in_executor(None, world.spawn, self.drone_class, rng)
+        drone_id = next(self.drone_ids)
+        session.flights[drone_id] = Flight(world, drone, self.tick)
+        return {'drone': drone_id, 'x': drone.x, 'y': drone.y}
+
+    def step(self):
+        self.tick += 1
+        report = self.tick % simulation.SENSOR_PERIOD_TICKS == 0
+        for session in list(self.sessions):
+            for flight in session.flights.values():
+                if flight.state in ACTIVE:
+                    stale = self.tick - flight.commanded_at > self.command_timeout
+                    command = simulation.HOVER if stale else flight.command
+                    try:
+                        flight.state = simulation.step(flight.world, flight.drone, command, self.dt)
+                    except Exception as error:
+                        # The tick loop is shared by every session; a drone
+                        # the simulation cannot step ends its own flight.
+                        flight.fail(error)
+            if report and session.flights:
+                session.push_telemetry({'op': 'telemetry', 'tick': self.tick, 'time': self.tick * self.dt,
+                                        'drones': self.readings(session.flights)})
+
+    def readings(self, flights):
+        # One batched sensor read per world instead of one per drone. Failed
+        # drones are left out of the read; if the batch still fails, each
+        # drone is read alone so the failure ends only the drones it hit.
+        by_world = collections.defaultdict(list)
+        for drone_id, flight in flights.items():
+            if flight.state != FAILED:
+                by_world[id(flight.world)].append((drone_id, flight))
+        distances = {}
+        for group in by_world.values():
+            try:
+                distances.update(zip((drone_id for drone_id, _ in group), self.read_sensors(group)))
+            except Exception:
+                for drone_id, flight in group:
+                    try:
+                        distances[drone_id], = self.read_sensors([(drone_id, flight)])
+                    except Exception as error:
+                        flight.fail(error)
+        records = []
+        for drone_id, flight in flights.items():
+            drone = flight.drone
+            record = {'drone': drone_id, 'state': flight.state, 'x': drone.x, 'y': drone.y,
+                      'distance': distances.get(drone_id), 'yaw': drone.yaw, 'Vx': drone.vx, 'Vy': drone.vy,
+                      'bat': drone.battery, 'pitch': drone.pitch, 'roll': drone.roll}
+            if flight.error is not None:
+                record['error'] = flight.error
+            records.append(record)
+        return records
+
+    @staticmethod
+    def read_sensors(group):
+        world = group[0][1].world
+        drones = [flight.drone for _, flight in group]
+        return world.sensors.read(np.array([drone.x for drone in drones], dtype=np.float64),
+                                  np.array([drone.y for drone in drones], dtype=np.float64),
+                                  np.array([drone.yaw for drone in drones], dtype=np.float64)).tolist()
+
+    async def run(self, ticks=None):
+        # Ticks at 1/dt per second times `speed`. A tick that runs late is not
+        # made up with a burst; the schedule restarts from now instead.
+        loop = asyncio.get_running_loop()
+        period = self.dt / self.speed if self.speed else 0
+        deadline = loop.time()
+        for _ in itertools.count() if ticks is None else range(ticks):
+            self.step()
+            if not period:
+                await asyncio.sleep(0)
+                continue
+            deadline += period
+            delay = deadline - loop.time()
+            if delay < -period:
+                deadline = loop.time()
+            await asyncio.sleep(max(delay, 0))
+
+
+class ControlClient:
+    # The controller's end of a connection. Replies are matched to their
+    # requests by ref; telemetry frames queue up to `telemetry_frames` deep,
+    # dropping the oldest, like the server's outbox.
+
+    def __init__(self, reader, writer, telemetry_frames=OUTBOX_FRAMES):
+        self.reader = reader
+        self.writer = writer
+        self.refs = itertools.count()
+        self.waiting = {}
+        self.frames = collections.deque(maxlen=telemetry_frames)
+        self.frame_ready = asyncio.Event()
+        self.reading = asyncio.ensure_future(self._read_loop())
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        return cls(*await asyncio.open_connection(host, port, limit=LINE_LIMIT))
+
+    @classmethod
+    async def connect_unix(cls, path):
+        return cls(*await asyncio.open_unix_connection(path, limit=LINE_LIMIT))
+
+    async def _read_loop(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message['op'] == 'telemetry':
+                    self.frames.append(message)
+                    self.frame_ready.set()
+                elif message.get('ref') in self.waiting:
+                    self.waiting.pop(message['ref']).set_result(message)
+        finally:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("control server closed the connection"))
+            self.frame_ready.set()
+
+    async def _send(self, message):
+        self.writer.write(json.dumps(message).encode() + b'\n')
+        await self.writer.drain()
+
+    async def _request(self, message):
+        ref = message['ref'] = next(self.refs)
+        future = self.waiting[ref] = asyncio.get_running_loop().create_future()
+        await self._send(message)
+        reply = await future
+        if reply['op'] == 'error':
+            raise ValueError(reply['error'])
+        return reply
+
+    async def spawn(self, map_id='maze:0', seed=None):
+        # Returns the new drone's id.
+        return (await self._request({'op': 'spawn', 'map': map_id, 'seed': seed}))['drone']
+
+    async def despawn(self, drone):
+        await self._request({'op': 'despawn', 'drone': drone})
+
+    async def command(self, commands):
+        # Sends simulation.Commands for any number of drones, keyed by drone
+        # id, in one frame.
+        await self._send({'op': 'command', 'commands': [
+            {'drone': drone, 'vx': command.vx, 'vy': command.vy, 'yaw': command.yaw}
+            for drone, command in commands.items()]})
+
+    async def telemetry(self):
+        # The oldest telemetry frame not yet returned, waiting for one if
+        # needed. Raises ConnectionError once the server is gone.
+        while not self.frames:
+            if self.reading.done():
+                raise ConnectionError("control server closed the connection")
+            self.frame_ready.clear()
+            await self.frame_ready.wait()
+        return self.frames.popleft()
+
+    async def close(self):
+        self.writer.close()
+        self.reading.cancel()
+
+
+async def serve(args):
+    server = ControlServer(speed=args.speed)
+    if args.unix:
+        listener = await server.serve_unix(args.unix)
+        print(f"listening on {args.unix}")
+    else:
+        listener = await server.serve_tcp(args.host, args.port)
+        print(f"listening on {args.host}:{args.port}")
+    async with listener:
+        await server.run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fly simulated drones from external controllers over a socket.")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', metavar='PATH', help="listen on a Unix socket instead of TCP")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="simulated seconds per real second; 0 ticks as fast as possible")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
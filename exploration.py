@@ -0,0 +1,570 @@
+import argparse
+import glob
+import json
+import math
+
+import numpy as np
+
+import kinematics
+import simulation
+
+UNKNOWN = 0
+FREE = 1
+OCCUPIED = 2
+
+# Neighbour steps of the search over the map, (dx, dy); diagonals come last
+# so that straight steps win ties.
+STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+# Fractions of the map's free cells that explore_episode reports the tick
+# count of reaching.
+COVERAGE_MARKS = (0.5, 0.9)
+# Turns the explorer makes where it starts and at each goal, each followed
+# by a scan, to look between its beams: nine turns of 6 degrees sweep the
+# 60 degrees between the default sensors' beams.
+ARRIVAL_TURNS_DEG = (6,) * 9
+# How close a drone with motion limits has to get to a waypoint.
+ARRIVAL_PX = 0.5
+# Plans the explorer tries in one tick when the oracle keeps finding walls
+# its map did not have.
+BUMP_RETRIES = 3
+# Cells around the drone the search for the nearest frontier looks in
+# before it searches all of the map seen so far.
+SEARCH_WINDOW_CELLS = 8
+# Pixels more than the drone's half-size that the centre of a cell it plans
+# through keeps from every wall echo.
+CLEARANCE_MARGIN_PX = 4
+# How fast the explorer flies without the oracle: the default drone moves
+# about a cell and a half between scans rather than four and a half at
+# cruise speed.
+EXPLORE_SPEED_MPS = 3.0
+# How many cells from the frontier a lookout may be. A passable cell has
+# no unknown neighbour, so the frontier is at least one cell away.
+LOOKOUT_CELLS = 2
+
+
+class OccupancyMap:
+    # A map of what the range sensors have seen so far, in square cells of
+    # cell_px pixels: unknown, free or occupied. A beam marks the cells it
+    # crossed free and the cell of its echo occupied, and an occupied cell
+    # stays occupied. The arrays carry a border of one occupied cell so that
+    # neighbourhoods never need bounds checks.
+    #
+    # The frontier is the free cells next to unknown ones. Every scan only
+    # touches the cells around its beams, so the frontier is only
+    # recomputed in the box of cells the scan changed, never over the whole
+    # map. Cells are the size of the drone's footprint, so a drone at the
+    # centre of a free cell fits in it, and are laid out with one centred
+    # on `around`, where the drone starts.
+    #
+    # A beam can cross a cell beside a wall without touching the wall
+    # pixels in it, so the drone only plans through passable cells: free
+    # ones whose centre is more than clearance_px from every echo along
+    # either axis, and whose eight neighbours have all been seen, so that
+    # no wall can hide next to them in a gap between beams. The lookouts
+    # are the passable cells within LOOKOUT_CELLS of the frontier, where
+    # the drone goes to look further.
+
+    def __init__(self, shape, cell_px, pixel_to_cm=simulation.PIXEL_TO_CM, around=(0, 0), clearance_px=None):
+        height, width = shape
+        self.shape = shape
+        self.cell_px = cell_px
+        self.pixel_to_cm = pixel_to_cm
+        self.clearance_px = cell_px / 2 + CLEARANCE_MARGIN_PX if clearance_px is None else clearance_px
+        # The pixel position of the top left corner of the first cell, at
+        # or above and left of the map's.
+        self.left, self.top = (-((cell_px / 2 - value) % cell_px) for value in around)
+        self.rows = int(math.ceil((height - self.top) / cell_px))
+        self.cols = int(math.ceil((width - self.left) / cell_px))
+        padded = (self.rows + 2, self.cols + 2)
+        self.cells = np.full(padded, UNKNOWN, dtype=np.uint8)
+        self.cells[[0, -1], :] = OCCUPIED
+        self.cells[:, [0, -1]] = OCCUPIED
+        self.frontier = np.zeros(padded, dtype=np.bool_)
+        self.frontier_cells = 0
+        self.near_wall = np.zeros(padded, dtype=np.bool_)
+        self.passable = np.zeros(padded, dtype=np.bool_)
+        self.lookout = np.zeros(padded, dtype=np.bool_)
+        # The box of cells seen so far, as padded (top, left, bottom, right).
+        self.known = None
+
+    def cell(self, x, y):
+        # The padded (row, col) of the cell under pixel position (x, y).
+        return int((y - self.top) // self.cell_px) + 1, int((x - self.left) // self.cell_px) + 1
+
+    def center(self, row, col):
+        return self.left + (col - 0.5) * self.cell_px, self.top + (row - 0.5) * self.cell_px
+
+    def scan(self, x, y, yaw, distances, angles, max_range_cm, footprint_px=0):
+        # Adds one set of range readings (cm) taken at (x, y) with the
+        # drone's heading yaw (degrees) and its beams at `angles` (radians)
+        # off it. The footprint around (x, y) is free too, or the drone
+        # would not be there.
+        distances = np.asarray(distances, dtype=np.float64) / self.pixel_to_cm
+        headings = math.radians(yaw) + np.asarray(angles)
+        # yaw 0 points up the screen (-y) and 90 to the right (+x).
+        dx, dy = np.sin(headings), -np.cos(headings)
+        spacing = self.cell_px / 2
+        t = np.arange(0, distances.max() + spacing, spacing)
+        along = t[None, :] < distances[:, None]
+        free_x = (x + dx[:, None] * t)[along]
+        free_y = (y + dy[:, None] * t)[along]
+        # The footprint covers pixels x - footprint_px to x + footprint_px - 1.
+        offsets = np.linspace(-footprint_px, footprint_px - 1, int(math.ceil(2 * footprint_px / spacing)) + 1)
+        free_x = np.concatenate([free_x, x + np.repeat(offsets, len(offsets))])
+        free_y = np.concatenate([free_y, y + np.tile(offsets, len(offsets))])
+        # A reading at max range saw no echo.
+        echo = distances < max_range_cm / self.pixel_to_cm
+        hit_x, hit_y = x + dx[echo] * distances[echo], y + dy[echo] * distances[echo]
+
+        free_rows, free_cols = self._cells_of(free_x, free_y)
+        hit_rows, hit_cols = self._cells_of(hit_x, hit_y)
+        near_rows, near_cols = self._cells_near(hit_x, hit_y)
+        rows = np.concatenate([free_rows, hit_rows, near_rows])
+        cols = np.concatenate([free_cols, hit_cols, near_cols])
+        if not len(rows):
+            return
+        top, left, bottom, right = rows.min(), cols.min(), rows.max() + 1, cols.max() + 1
+        seen = self.cells[free_rows, free_cols]
+        self.cells[free_rows, free_cols] = np.where(seen == OCCUPIED, OCCUPIED, FREE)
+        self.cells[hit_rows, hit_cols] = OCCUPIED
+        self.near_wall[near_rows, near_cols] = True
+        if self.known is None:
+            self.known = (top, left, bottom, right)
+        else:
+            self.known = (min(self.known[0], top), min(self.known[1], left), max(self.known[2], bottom),
+                          max(self.known[3], right))
+        self._update(top, left, bottom, right)
+
+    def mark_occupied(self, x, y):
+        # Returns whether the map did not have it already.
+        rows, cols = self._cells_of(np.array([x]), np.array([y]))
+        if not len(rows) or self.cells[rows[0], cols[0]] == OCCUPIED:
+            return False
+        self.cells[rows[0], cols[0]] = OCCUPIED
+        near_rows, near_cols = self._cells_near(np.array([x]), np.array([y]))
+        self.near_wall[near_rows, near_cols] = True
+        rows, cols = np.append(near_rows, rows), np.append(near_cols, cols)
+        self._update(rows.min(), cols.min(), rows.max() + 1, cols.max() + 1)
+        return True
+
+    def _cells_of(self, x, y):
+        rows = np.floor((y - self.top) / self.cell_px).astype(np.int64) + 1
+        cols = np.floor((x - self.left) / self.cell_px).astype(np.int64) + 1
+        inside = (rows >= 1) & (rows <= self.rows) & (cols >= 1) & (cols <= self.cols)
+        return rows[inside], cols[inside]
+
+    def _cells_near(self, x, y):
+        # The cells whose centre is within clearance_px of a point along
+        # both axes.
+        cells = int(math.ceil(self.clearance_px / self.cell_px))
+        reach = np.arange(-cells, cells + 1)
+        rows = (np.floor((y - self.top) / self.cell_px).astype(np.int64) + 1)[:, None, None] + reach[None, :, None]
+        cols = (np.floor((x - self.left) / self.cell_px).astype(np.int64) + 1)[:, None, None] + reach[None, None, :]
+        rows, cols = np.broadcast_arrays(rows, cols)
+        centre_x, centre_y = self.center(rows, cols)
+        near = ((np.abs(centre_x - x[:, None, None]) < self.clearance_px)
+                & (np.abs(centre_y - y[:, None, None]) < self.clearance_px)
+                & (rows >= 1) & (rows <= self.rows) & (cols >= 1) & (cols <= self.cols))
+        return rows[near], cols[near]
+
+    def _update(self, top, left, bottom, right):
+        # A cell's frontier and passable states depend on its neighbours,
+        # so a change spreads one cell out, and lookouts LOOKOUT_CELLS more.
+        t, l, b, r = max(top - 1, 1), max(left - 1, 1), min(bottom + 1, self.rows + 1), min(right + 1, self.cols + 1)
+        cells = self.cells[t - 1:b + 1, l - 1:r + 1]
+        free, unknown = cells == FREE, cells == UNKNOWN
+        frontier = free[1:-1, 1:-1] & (unknown[:-2, 1:-1] | unknown[2:, 1:-1] | unknown[1:-1, :-2]
+                                       | unknown[1:-1, 2:])
+        self.frontier_cells += int(frontier.sum()) - int(self.frontier[t:b, l:r].sum())
+        self.frontier[t:b, l:r] = frontier
+        seen = ~unknown[:-2] & ~unknown[1:-1] & ~unknown[2:]
+        seen = seen[:, :-2] & seen[:, 1:-1] & seen[:, 2:]
+        self.passable[t:b, l:r] = free[1:-1, 1:-1] & seen & ~self.near_wall[t:b, l:r]
+        reach = LOOKOUT_CELLS
+        t, l = max(t - reach, 1), max(l - reach, 1)
+        b, r = min(b + reach, self.rows + 1), min(r + reach, self.cols + 1)
+        # The frontier around the box, with nothing past the padded array.
+        frontier = np.zeros((b - t + 2 * reach, r - l + 2 * reach), dtype=np.bool_)
+        ft, fl = max(t - reach, 0), max(l - reach, 0)
+        fb, fr = min(b + reach, self.rows + 2), min(r + reach, self.cols + 2)
+        frontier[ft - t + reach:fb - t + reach, fl - l + reach:fr - l + reach] = self.frontier[ft:fb, fl:fr]
+        height, width = b - t, r - l
+        near = np.zeros((height, width), dtype=np.bool_)
+        for dy in range(2 * reach + 1):
+            for dx in range(2 * reach + 1):
+                near |= frontier[dy:dy + height, dx:dx + width]
+        self.lookout[t:b, l:r] = self.passable[t:b, l:r] & near
+
+    def open_cells(self, grid):
+        # The cells without a wall pixel of the occupancy grid the map is
+        # being made of, which a complete exploration maps free. Cells along
+        # walls may end up mapped either way and are left out.
+        height, width = self.shape
+        left, top = int(-self.left), int(-self.top)
+        padded = np.ones((self.rows * self.cell_px, self.cols * self.cell_px), dtype=np.bool_)
+        padded[top:top + height, left:left + width] = grid
+        return ~padded.reshape(self.rows, self.cell_px, self.cols, self.cell_px).any(axis=(1, 3))
+
+    def coverage(self, open_cells):
+        # The share of open_cells that the map has as free.
+        total = int(open_cells.sum())
+        return int((self.cells[1:-1, 1:-1] == FREE)[open_cells].sum()) / total if total else 1.0
+
+    def search(self, start, exhausted=None):
+        # Breadth-first search through passable cells, from the padded cell
+        # `start`, for the nearest lookout that is not exhausted.
+        # Returns the cells from start to the goal, or None when no lookout
+        # is in reach.
+        #
+        # The search runs over the box of cells seen so far, and first over
+        # just the cells around the start: a goal found there within as
+        # many steps as that window reaches is the nearest one anywhere, as
+        # no path that short leaves the window.
+        top, left, bottom, right = self.known
+        top, left, bottom, right = top - 1, left - 1, bottom + 1, right + 1
+        row, col = start
+        reach = SEARCH_WINDOW_CELLS
+        window = (max(top, row - reach), max(left, col - reach), min(bottom, row + reach + 1),
+                  min(right, col + reach + 1))
+        path = self._search(start, window, exhausted)
+        if (path is not None and len(path) - 1 <= reach) or window == (top, left, bottom, right):
+            return path
+        return self._search(start, (top, left, bottom, right), exhausted)
+
+    def _search(self, start, box, exhausted):
+        # The search of one box of cells. Whole wavefronts are expanded at
+        # once.
+        top, left, bottom, right = box
+        free = self.passable[top:bottom, left:right].copy()
+        goals = self.lookout[top:bottom, left:right].copy()
+        if exhausted is not None:
+            goals &= ~exhausted[top:bottom, left:right]
+        start = (start[0] - top, start[1] - left)
+        if not (0 <= start[0] < free.shape[0] and 0 <= start[1] < free.shape[1]):
+            return None
+        # The drone leaves from where it is, even from a cell that is not
+        # passable, and is past being a goal itself.
+        free[start] = True
+        goals[start] = False
+
+        # Each step direction as the slices of the grid it moves from and
+        # to, and the cells it may enter. Stepping diagonally, the footprint
+        # crosses the corners of the two cells beside the step, and wall
+        # corners are where the beams see least, so those cells have to be
+        # passable too.
+        height, width = free.shape
+        moves = []
+        for direction, (dx, dy) in enumerate(STEPS):
+            source = (slice(max(-dy, 0), height + min(-dy, 0)), slice(max(-dx, 0), width + min(-dx, 0)))
+            target = (slice(max(dy, 0), height + min(dy, 0)), slice(max(dx, 0), width + min(dx, 0)))
+            enterable = free[target]
+            if dx and dy:
+                enterable = enterable & free[source[0], target[1]] & free[target[0], source[1]]
+            moves.append((direction, source, target, enterable))
+
+        came_from = np.full(free.shape, -1, dtype=np.int8)
+        came_from[start] = len(STEPS)
+        unvisited = np.ones(free.shape, dtype=np.bool_)
+        unvisited[start] = False
+        wave = np.zeros(free.shape, dtype=np.bool_)
+        wave[start] = True
+        while wave.any():
+            reached = wave & goals
+            if reached.any():
+                rows, cols = np.nonzero(reached)
+                goal = (int(rows[0]), int(cols[0]))
+                break
+            next_wave = np.zeros_like(wave)
+            for direction, source, target, enterable in moves:
+                new = wave[source] & enterable & unvisited[target]
+                came_from[target][new] = direction
+                unvisited[target] &= ~new
+                next_wave[target] |= new
+            wave = next_wave
+        else:
+            return None
+
+        path = [goal]
+        row, col = goal
+        while came_from[row, col] != len(STEPS):
+            dx, dy = STEPS[came_from[row, col]]
+            row, col = row - dy, col - dx
+            path.append((row, col))
+        return [(row + top, col + left) for row, col in reversed(path)]
+
+    def line_clear(self, a, b, radius):
+        # Whether a drone with a square footprint of half-size radius can fly
+        # the straight line between two pixel positions: once it leaves, its
+        # centre and corners stay in passable cells, though its centre may
+        # cross the rest of the cell it leaves from.
+        (x0, y0), (x1, y1) = a, b
+        samples = int(math.ceil(math.hypot(x1 - x0, y1 - y0) / (self.cell_px / 2))) + 1
+        # The centre, then the corners: the footprint covers pixels
+        # x - radius to x + radius - 1.
+        offsets = np.array([[0, 0], [-radius, -radius], [radius - 1, -radius], [-radius, radius - 1],
+                            [radius - 1, radius - 1]], dtype=np.float64)
+        x = np.linspace(x0, x1, samples) + offsets[:, :1]
+        y = np.linspace(y0, y1, samples) + offsets[:, 1:]
+        rows = np.floor((y - self.top) / self.cell_px).astype(np.int64) + 1
+        cols = np.floor((x - self.left) / self.cell_px).astype(np.int64) + 1
+        if rows[0].min() < 1 or rows[0].max() > self.rows or cols[0].min() < 1 or cols[0].max() > self.cols:
+            return False
+        # Off the map is the border, which is never passable.
+        passable = self.passable[np.clip(rows, 0, self.rows + 1), np.clip(cols, 0, self.cols + 1)]
+        centre = passable[0] | ((rows[0] == rows[0, 0]) & (cols[0] == cols[0, 0]))
+        return bool(centre.all() and passable[1:, 1:].all())
+
+
+def cell_size(drone_class):
+    # Map cells the size of the drone's footprint, as the planner's lattice.
+    return max(2 * int(drone_class.radius_px), 1)
+
+
+class Explorer:
+    # A controller for simulation.run_episode that maps the world from the
+    # drone's range readings and flies to the nearest frontier it can reach
+    # through cells it has seen to be free, until no frontier is left. It
+    # scans at the sensor rate, as the telemetry does, while it is in
+    # control; the flight home is left to the home field.
+    #
+    # The beams only sample the cells they cross, so a free cell can still
+    # hold a wall. The explorer plans through passable cells only, which
+    # keeps it out of cells next to anything unseen: it stops and turns
+    # its beams around where it starts and at every goal to see them, and
+    # flies at EXPLORE_SPEED_MPS, so it scans again before it gets far
+    # into what the last scan missed. A wall that still gets past all of
+    # that is a real crash and ends the episode. With oracle=True it also checks each
+    # command one tick ahead with the world's collision test, like
+    # random_walk, maps what it would hit and flies at cruise speed. That is
+    # ground truth a real drone does not have, kept as a reference.
+    # Drones with motion limits are slowed to stop at every waypoint, but
+    # can still drift into walls the map puts them right beside.
+
+    def __init__(self, shape, cell_px=None, speed_mps=None, dt=simulation.FIXED_DT, oracle=False):
+        self.shape = shape
+        self.cell_px = cell_px
+        self.speed_mps = speed_mps
+        self.dt = dt
+        self.oracle = oracle
+        self.map = None
+        self.exhausted = None
+        self.waypoints = []
+        self.goal = None
+        self.arrived = None
+        self.calls = 0
+        self.scans = 0
+        self.plans = 0
+        self.complete = False
+
+    def __call__(self, world, drone):
+        if self.map is None:
+            # The oracle catches the walls the map misses, so with it the
+            # drone keeps no clearance from the echoes.
+            self.map = OccupancyMap(self.shape, self.cell_px or cell_size(type(drone)), drone.pixel_to_cm,
+                                    (drone.x, drone.y), 0 if self.oracle else None)
+            self.exhausted = np.zeros_like(self.map.frontier)
+            # The first scan only sees along the beams; look around first.
+            self.goal, self.arrived = self.map.cell(drone.x, drone.y), 0
+        scanned = self.calls % simulation.SENSOR_PERIOD_TICKS == 0 or self.arrived is not None
+        if scanned:
+            self.scan(drone)
+        self.calls += 1
+        if self.arrived is not None:
+            # At the goal: turn the beams into the gaps between them while
+            # the goal still looks onto the frontier, or has unseen cells
+            # around it. Whatever is still unknown around it after that
+            # stays out of sight from there.
+            looking = self.map.lookout[self.goal] or not self.map.passable[self.goal]
+            if self.arrived < len(ARRIVAL_TURNS_DEG) and looking:
+                self.arrived += 1
+                return simulation.Command(0, 0, (drone.yaw + ARRIVAL_TURNS_DEG[self.arrived - 1]) % 360)
+            self.exhausted[self.goal] = True
+            self.arrived = None
+
+        if self.goal is not None and not self.map.lookout[self.goal]:
+            self.waypoints = []  # seen on the way there
+        if scanned and self.waypoints and not self.map.line_clear((drone.x, drone.y), self.waypoints[0],
+                                                                  drone.radius_px):
+            self.waypoints = []  # a wall turned up on the way
+        for _ in range(BUMP_RETRIES):
+            if not self.waypoints:
+                self.plan(drone)
+            if not self.waypoints:
+                self.complete = True
+                return simulation.HOVER
+            self.complete = False
+            command = self.fly(drone)
+            contact = self.bump(world, drone, command) if self.oracle else None
+            if contact is None:
+                return command
+            wall, (normal_x, normal_y) = contact
+            # The beams missed a wall in a cell they crossed.
+            if self.map.mark_occupied(*wall):
+                self.waypoints = []
+                continue
+            # The map had it already: the drone is cutting past a wall in a
+            # cell beside its way. It slides along the wall, or gives the
+            # goal up when it cannot.
+            into = command.vx * normal_x + command.vy * normal_y
+            slide = simulation.Command(command.vx - into * normal_x, command.vy - into * normal_y, command.yaw)
+            if (slide.vx or slide.vy) and self.bump(world, drone, slide) is None:
+                return slide
+            self.exhausted[self.goal] = True
+            self.waypoints = []
+        return simulation.HOVER
+
+    def scan(self, drone):
+        sensors = drone.sensors
+        self.map.scan(drone.x, drone.y, drone.yaw, drone.update_sensors()['distance'], sensors.angles,
+                      sensors.max_range_cm, drone.radius_px)
+        self.scans += 1
+
+    def plan(self, drone):
+        self.plans += 1
+        cells = self.map.search(self.map.cell(drone.x, drone.y), self.exhausted)
+        if cells is None:
+            self.goal = None
+            return
+        self.goal = cells[-1]
+        # Along the staircase of cells, from the centre of the drone's own
+        # cell unless it is not passable, straightened into the fewest legs
+        # the map says are clear.
+        if not self.map.passable[cells[0]]:
+            cells = cells[1:]
+        points = [self.map.center(*cell) for cell in cells]
+        waypoints = []
+        anchor = (drone.x, drone.y)
+        for index, point in enumerate(points[1:], 1):
+            if not self.map.line_clear(anchor, point, drone.radius_px):
+                anchor = points[index - 1]
+                waypoints.append(anchor)
+        self.waypoints = waypoints + points[-1:]
+
+    def fly(self, drone):
+        speed = self.speed_mps or (drone.cruise_speed_mps if self.oracle
+                                   else min(drone.cruise_speed_mps, EXPLORE_SPEED_MPS))
+        ticks = self.dt * simulation.TICK_RATE
+        target_x, target_y = self.waypoints[0]
+        dx, dy = target_x - drone.x, target_y - drone.y
+        distance = math.hypot(dx, dy)
+        if kinematics.is_limited(type(drone)):
+            # Slow down in time to stop at the waypoint.
+            rate = min(kinematics.acceleration_limits(type(drone)))
+            speed = min(speed, math.sqrt(2 * rate * distance * drone.pixel_to_cm / simulation.TICK_RATE))
+            step = ARRIVAL_PX
+        else:
+            # Land exactly on the waypoint rather than overshoot it.
+            step = speed / drone.pixel_to_cm * ticks
+        if distance <= step:
+            self.waypoints.pop(0)
+            if not self.waypoints:
+                self.arrived = 0
+            scale = drone.pixel_to_cm / ticks
+        else:
+            scale = speed / distance
+        yaw = math.degrees(math.atan2(dx, -dy)) % 360 if distance else None
+        return simulation.Command(dx * scale, dy * scale, yaw)
+
+    def next_position(self, drone, command):
+        ticks = self.dt * simulation.TICK_RATE
+        if not kinematics.is_limited(type(drone)):
+            return drone.x + command.vx / drone.pixel_to_cm * ticks, drone.y + command.vy / drone.pixel_to_cm * ticks
+        target_yaw = command.yaw if command.yaw is not None else drone.target_yaw
+        x, y = kinematics.integrate(drone.x, drone.y, drone.vx, drone.vy, drone.yaw, command.vx, command.vy,
+                                    math.nan if target_yaw is None else target_yaw, self.dt, type(drone),
+                                    simulation.TICK_RATE / drone.pixel_to_cm)[:2]
+        return float(x), float(y)
+
+    def bump(self, world, drone, command):
+        # Like random_walk, looks one tick ahead with the world's collision
+        # test. Returns a point in the wall the command would fly into and
+        # the normal of the face it would touch, or None when the way is
+        # clear.
+        end_x, end_y = self.next_position(drone, command)
+        if (end_x, end_y) == (drone.x, drone.y):
+            return None
+        hit, t, normal_x, normal_y = world.sweep(drone.x, drone.y, end_x, end_y, drone.radius_px)
+        if not hit:
+            return None
+        x, y = drone.x + float(t) * (end_x - drone.x), drone.y + float(t) * (end_y - drone.y)
+        normal = float(normal_x), float(normal_y)
+        if any(normal):
+            away_x, away_y = -normal[0], -normal[1]
+        else:
+            distance = math.hypot(end_x - drone.x, end_y - drone.y)
+            away_x, away_y = (end_x - drone.x) / distance, (end_y - drone.y) / distance
+        reach = drone.radius_px + 1
+        return (x + away_x * reach, y + away_y * reach), normal
+
+
+def explore_episode(world, seed=None, max_ticks=100000, drone_class=simulation.Drone, speed_mps=None, oracle=False):
+    # Runs one episode under an Explorer and adds how much of the map it
+    # mapped: the share of the open cells it mapped free, the tick it
+    # passed each of COVERAGE_MARKS, and whether it ran out of frontier.
+    explorer = Explorer(world.grid.shape, speed_mps=speed_mps, oracle=oracle)
+    marks = {}
+    open_mask = []
+    scans = [0]
+
+    def coverage():
+        if not open_mask:
+            open_mask.append(explorer.map.open_cells(world.grid))
+        return explorer.map.coverage(open_mask[0])
+
+    def track(world, drone):
+        command = explorer(world, drone)
+        if explorer.scans != scans[0]:
+            scans[0] = explorer.scans
+            mapped = coverage()
+            for mark in COVERAGE_MARKS:
+                if mapped >= mark and mark not in marks:
+                    marks[mark] = explorer.calls
+        return command
+
+    result = simulation.run_episode(world, track, seed, max_ticks, drone_class=drone_class,
+                                    stop=lambda: explorer.complete)
+    result.update({
+        'coverage': coverage() if explorer.map is not None else 0.0,
+        'complete': explorer.complete,
+        'frontier_cells': explorer.map.frontier_cells if explorer.map is not None else 0,
+        'scans': explorer.scans,
+        'plans': explorer.plans,
+        'oracle': oracle,
+    })
+    for mark in COVERAGE_MARKS:
+        result[f'ticks_to_{int(mark * 100)}pct'] = marks.get(mark)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Explore maps autonomously and report how much of them gets mapped.")
+    parser.add_argument('maps', nargs='*', default=[simulation.MAZE_PREFIX + '0'],
+                        help="map images, glob patterns or map ids such as maze:0 (default: maze:0)")
+    parser.add_argument('--episodes', type=int, default=5, help="episodes per map")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-ticks', type=int, default=100000)
+    parser.add_argument('--battery', type=float, default=None,
+                        help="battery life in seconds; the default drone's lasts a few seconds of flight")
+    parser.add_argument('--oracle', action='store_true',
+                        help="check every move against the world's walls before flying it, at cruise speed")
+    args = parser.parse_args(argv)
+
+    drone_class = simulation.Drone
+    if args.battery is not None:
+        drone_class = type('Drone', (simulation.Drone,), {'max_battery': args.battery})
+    map_ids = []
+    for pattern in args.maps:
+        if pattern.startswith((simulation.MAZE_PREFIX, simulation.TILES_PREFIX)):
+            map_ids.append(pattern)
+        else:
+            map_ids.extend(sorted(glob.glob(pattern)) or [pattern])
+    for map_id in map_ids:
+        world = simulation.World.from_id(map_id)
+        for episode in range(args.episodes):
+            result = explore_episode(world, args.seed + episode, args.max_ticks, drone_class, oracle=args.oracle)
+            result['map'] = map_id
+            print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import numpy as np
+
+GRAVITY_MPS2 = 9.81
+
+# Drone class attributes that limit its motion; None leaves that part of the
+# motion unlimited. A drone with none of them set changes velocity and
+# heading the instant it is commanded to, as the game always did.
+LIMITS = ('max_acceleration_mps2', 'max_pitch_deg', 'max_roll_deg', 'max_yaw_rate_dps')
+
+
+def is_limited(drone_class):
+    return any(getattr(drone_class, name, None) is not None for name in LIMITS)
+
+
+def acceleration_limits(drone_class):
+    # (total, forward, lateral) acceleration in m/s^2. A multicopter gets
+    # horizontal acceleration by tilting, g * tan(tilt), so the pitch limit
+    # bounds acceleration along the heading and the roll limit across it.
+    def limit(value, convert=lambda value: value):
+        return np.inf if value is None else convert(value)
+
+    def tilt(degrees):
+        return GRAVITY_MPS2 * np.tan(np.radians(degrees))
+
+    return (limit(drone_class.max_acceleration_mps2), limit(drone_class.max_pitch_deg, tilt),
+            limit(drone_class.max_roll_deg, tilt))
+
+
+def integrate(x, y, vx, vy, yaw, target_vx, target_vy, target_yaw, dt, drone_class, px_per_m):
+    # Advances position (px), velocity (m/s) and yaw (degrees) by dt seconds
+    # towards a velocity and yaw setpoint, and returns them with the pitch
+    # and roll the drone flies at the end of the step. Works on scalars for
+    # one drone and on arrays for many; a NaN target_yaw keeps the heading.
+    #
+    # The drone accelerates straight towards the velocity setpoint at the
+    # largest rate its limits allow in that direction, until it gets there.
+    # Within a step that is constant acceleration followed by constant
+    # velocity, which is integrated exactly rather than with an Euler or
+    # Runge-Kutta step, so a step of any dt lands where the same time in
+    # small steps would: fast-forwarding does not change the trajectory.
+    # The heading turns at the yaw rate limit, and the attitude limits are
+    # taken along the heading at the start of the step.
+    total, forward, lateral = acceleration_limits(drone_class)
+    heading = np.radians(yaw)
+    # yaw 0 points up the screen (-y) and 90 to the right (+x).
+    forward_x, forward_y = np.sin(heading), -np.cos(heading)
+
+    dvx, dvy = target_vx - vx, target_vy - vy
+    dv = np.hypot(dvx, dvy)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        along = np.abs(dvx * forward_x + dvy * forward_y) / dv
+        across = np.abs(dvy * forward_x - dvx * forward_y) / dv
+        rate = np.minimum(total, np.minimum(forward / along, lateral / across))
+        reached = (dv == 0) | (dv <= rate * dt)
+        ax = np.where(reached, 0.0, dvx / dv * rate)
+        ay = np.where(reached, 0.0, dvy / dv * rate)
+        # Time spent accelerating when the setpoint is reached within the step.
+        ramp = np.where(reached & (dv > 0), dv / rate, 0.0)
+    step_x = vx * dt + np.where(reached, dvx * (dt - ramp / 2), ax * dt * dt / 2)
+    step_y = vy * dt + np.where(reached, dvy * (dt - ramp / 2), ay * dt * dt / 2)
+    new_vx = np.where(reached, target_vx, vx + ax * dt)
+    new_vy = np.where(reached, target_vy, vy + ay * dt)
+
+    # Positive pitch tilts the drone to accelerate forward, positive roll
+    # to accelerate to the right.
+    pitch = np.degrees(np.arctan((ax * forward_x + ay * forward_y) / GRAVITY_MPS2))
+    roll = np.degrees(np.arctan((ay * forward_x - ax * forward_y) / GRAVITY_MPS2))
+
+    target_yaw = np.where(np.isnan(target_yaw), yaw, target_yaw)
+    turn = (target_yaw - yaw + 180) % 360 - 180
+    if drone_class.max_yaw_rate_dps is not None:
+        max_turn = drone_class.max_yaw_rate_dps * dt
+        turn = np.clip(turn, -max_turn, max_turn)
+    new_yaw = (yaw + turn) % 360
+    return x + step_x * px_per_m, y + step_y * px_per_m, new_vx, new_vy, new_yaw, pitch, roll
@@ -0,0 +1,138 @@
+import argparse
+import math
+import os
+import random
+
+import profiling
+import random_map
+import replay
+import simulation
+import telemetry
+import tiles
+
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+ZOOM_STEP = 1.25
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+BLUE = (0, 0, 255)
+RED = (255, 0, 0)
+
+
+class Drone(simulation.Drone):
+    def draw(self, screen, camera, origin):
+        import pygame
+
+        x, y = camera.to_screen(self.x + origin[0], self.y + origin[1])
+        arrow_length = max(self.radius_px * 2 * camera.zoom, 4)
+        end_x = x + arrow_length * math.sin(math.radians(self.yaw))
+        end_y = y - arrow_length * math.cos(math.radians(self.yaw))
+        color = RED if self.crashed else BLUE
+        pygame.draw.line(screen, color, (x, y), (end_x, end_y), 3)
+        pygame.draw.circle(screen, color, (int(x), int(y)), max(int(self.radius_px * camera.zoom), 2))
+
+
+def spawn(tiled_map, rng=random):
+    # Picks a free spot anywhere on the map and loads only the region the
+    # drone can reach from there.
+    reach = tiles.reach_px(Drone)
+    while True:
+        x, y = tiled_map.random_free_point(rng)
+        world = tiled_map.world_around(x, y, reach)
+        seed = rng.randrange(2 ** 32)
+        try:
+            return world, seed, world.spawn(Drone, random.Random(seed))
+        except ValueError:
+            continue  # too cramped around this point to fit the drone
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fly over a tiled map of any size with a scrolling camera.")
+    parser.add_argument('directory', help="a tiled map made with tiles.py")
+    parser.add_argument('--zoom', type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    import pygame
+
+    import rendering
+
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Drone Large Map Navigation")
+    font = pygame.font.SysFont('Arial', 20)
+
+    tiled_map = tiles.TiledMap(args.directory)
+    camera = rendering.Camera(SCREEN_WIDTH, SCREEN_HEIGHT, args.zoom)
+    renderer = rendering.TiledMapRenderer(screen, tiled_map, camera, BLACK, WHITE)
+    telemetry_writer = telemetry.TelemetryWriter(telemetry.default_path())
+    record_dir = os.environ.get('DRONE_RECORD_DIR')
+
+    world, seed, drone = spawn(tiled_map)
+    recorder = replay.FlightRecorder(world.map_id, seed, drone) if record_dir else None
+    clock = pygame.time.Clock()
+    profiler = profiling.from_env()
+    span = profiler.span
+    overlay = rendering.ProfileOverlay(profiler, pygame.font.Font(None, 20), (-10, 10))
+    tick = 0
+    running = True
+    while running:
+        with span('events'):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.MOUSEWHEEL:
+                    camera.zoom_by(ZOOM_STEP ** event.y)
+                elif event.type == pygame.KEYDOWN and event.key in (pygame.K_PLUS, pygame.K_EQUALS,
+                                                                    pygame.K_KP_PLUS):
+                    camera.zoom_by(ZOOM_STEP)
+                elif event.type == pygame.KEYDOWN and event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    camera.zoom_by(1 / ZOOM_STEP)
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    overlay.toggle()
+
+        with span('step'):
+            command = random_map.keyboard_command(pygame.key.get_pressed(), drone.cruise_speed_mps)
+            state = simulation.step(world, drone, command)
+        tick += 1
+        profiler.tick()
+        with span('telemetry'):
+            if recorder is not None:
+                recorder.record(command, state)
+            if tick % simulation.SENSOR_PERIOD_TICKS == 0:
+                telemetry_writer.log(tick / simulation.TICK_RATE, tick, drone, drone.update_sensors())
+
+        origin_x, origin_y = world.origin
+        camera.follow(drone.x + origin_x, drone.y + origin_y)
+        with span('draw'):
+            renderer.begin_frame()
+            renderer.draw_path(drone.path.array() + world.origin, BLACK, 2)
+            drone.draw(screen, camera, world.origin)
+        with span('hud'):
+            info = font.render(f"{state}, battery: {drone.battery / drone.max_battery:.0%}, "
+                               f"map: ({drone.x + origin_x:.0f}, {drone.y + origin_y:.0f}), zoom: {camera.zoom:.2f}",
+                               True, BLACK, WHITE)
+            screen.blit(info, (10, 10))
+            overlay.draw(screen)
+        with span('present'):
+            renderer.end_frame()
+        with span('wait'):
+            clock.tick(simulation.TICK_RATE)
+        profiler.end_frame()
+
+        if state in (simulation.LANDED, simulation.STRANDED, simulation.CRASHED):
+            print(f"flight ended {state} at map ({drone.x + origin_x:.0f}, {drone.y + origin_y:.0f})")
+            if recorder is not None:
+                recorder.save(replay.default_path(seed, record_dir))
+            world, seed, drone = spawn(tiled_map)
+            recorder = replay.FlightRecorder(world.map_id, seed, drone) if record_dir else None
+
+    profiler.close()
+    telemetry_writer.close()
+    if recorder is not None:
+        recorder.save(replay.default_path(seed, record_dir))
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
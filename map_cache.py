@@ -0,0 +1,102 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+import occupancy
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'simulated-drone', 'maps')
+DEFAULT_MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def cache_dir():
+    return os.environ.get('DRONE_MAP_CACHE', DEFAULT_CACHE_DIR)
+
+
+def cache_key(image_bytes, width, height, threshold, mode, top_margin):
+    digest = hashlib.sha256()
+    digest.update(image_bytes)
+    # The content hash alone is not enough: the same image preprocessed at a
+    # different resolution or threshold gives a different grid.
+    digest.update(repr((CACHE_FORMAT_VERSION, width, height, threshold, mode, top_margin)).encode())
+    return digest.hexdigest()
+
+
+def load_grid(image_path, width=occupancy.SCREEN_WIDTH, height=occupancy.SCREEN_HEIGHT,
+              threshold=occupancy.OBSTACLE_COLOR_THRESHOLD, mode='tuple',
+              top_margin=occupancy.INFO_DISPLAY_HEIGHT, directory=None, max_bytes=DEFAULT_MAX_CACHE_BYTES):
+    directory = directory or cache_dir()
+    with open(image_path, 'rb') as f:
+        key = cache_key(f.read(), width, height, threshold, mode, top_margin)
+    path = os.path.join(directory, key + '.npy')
+
+    try:
+        grid = np.load(path, mmap_mode='r')
+        os.utime(path)
+        return grid
+    except (FileNotFoundError, ValueError):
+        pass
+
+    grid = occupancy.load_occupancy_grid(image_path, width, height, threshold, mode, top_margin)
+    store_grid(path, grid)
+    evict(directory, max_bytes, keep=path)
+    return np.load(path, mmap_mode='r')
+
+
+def store_grid(path, grid):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Write to a private file and rename it into place so that concurrent
+    # processes never observe a partially written entry.
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.ascontiguousarray(grid, dtype=np.bool_))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def evict(directory, max_bytes, keep=None):
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith('.npy'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            # Another process evicted it first, or it is still mapped on a
+            # platform that refuses to unlink open files.
+            continue
+        total -= size
+
+
+def clear(directory=None):
+    directory = directory or cache_dir()
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith('.npy') or name.endswith('.tmp'):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
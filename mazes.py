@@ -0,0 +1,247 @@
+import random
+
+import numpy as np
+
+import occupancy
+
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+CELL_SIZE = 40
+CAVE_FILL = 0.45
+CAVE_SMOOTHING = 5
+PRIM_BATCH = 0.25  # fraction of the frontier joining the tree per round
+
+
+def backtracker(rows, cols, rng=random):
+    # Same maze random_map carves: passages on odd cells, walls between
+    # them knocked out by a depth-first walk. Returns blocked cells as a
+    # bool array. The walk keeps its own stack, so the maze size is not
+    # bounded by the recursion limit.
+    blocked = np.ones((rows, cols), dtype=np.bool_)
+    if rows < 3 or cols < 3:
+        return blocked
+    x, y = rng.randint(0, cols - 1), rng.randint(0, rows - 1)
+    x, y = x + (x % 2 == 0), y + (y % 2 == 0)
+    # random_map's draw can round up past the last odd cell, which left it
+    # all wall. Only such a coordinate is drawn again, so every seed that
+    # carved a maze before still carves the same one.
+    if x >= cols:
+        x = rng.randrange(1, cols - 1, 2)
+    if y >= rows:
+        y = rng.randrange(1, rows - 1, 2)
+    # The walk runs on a flat bytearray, which is much faster to index
+    # from Python than the NumPy array, and tries the directions in the
+    # same order as before so that every seed carves the same maze.
+    carved = bytearray(rows * cols)
+    carved[y * cols + x] = 1
+    stack = [(x, y)]
+    up, down, left, right = (0, -1), (0, 1), (-1, 0), (1, 0)
+    while stack:
+        x, y = stack[-1]
+        cell = y * cols + x
+        options = []
+        if y >= 2 and not carved[cell - 2 * cols]:
+            options.append(up)
+        if y + 2 < rows and not carved[cell + 2 * cols]:
+            options.append(down)
+        if x >= 2 and not carved[cell - 2]:
+            options.append(left)
+        if x + 2 < cols and not carved[cell + 2]:
+            options.append(right)
+        if not options:
+            stack.pop()
+            continue
+        dx, dy = rng.choice(options)
+        carved[cell + dy * cols + dx] = 1
+        carved[cell + 2 * (dy * cols + dx)] = 1
+        stack.append((x + 2 * dx, y + 2 * dy))
+    return np.frombuffer(carved, dtype=np.uint8).reshape(rows, cols) == 0
+
+
+def _node_cells(rows, cols):
+    # Passage nodes sit on odd cells, as in backtracker: node (i, j) is cell
+    # (2i + 1, 2j + 1) and the wall between two neighbouring nodes is the
+    # cell half-way between them.
+    return rows // 2, cols // 2
+
+
+def spanning_tree(ny, nx, rng):
+    # Random spanning tree of the ny x nx node lattice, as a bool per edge:
+    # the ny * (nx - 1) horizontal edges in row-major order, then the
+    # (ny - 1) * nx vertical ones. Every edge gets a distinct random weight
+    # (a random high half over the edge index) and the minimum spanning tree
+    # is found with Boruvka's algorithm, which only needs whole-array steps:
+    # each round every component picks its cheapest outgoing edge, the
+    # picks are merged by pointer jumping and the edges are relabelled to
+    # the merged components. Each round at least halves the components.
+    n = ny * nx
+    chosen = np.zeros(ny * (nx - 1) + (ny - 1) * nx, dtype=np.bool_)
+    if n < 2:
+        return chosen
+    node = np.arange(n, dtype=np.int32).reshape(ny, nx)
+    u = np.concatenate([node[:, :-1].ravel(), node[:-1, :].ravel()])
+    v = np.concatenate([node[:, 1:].ravel(), node[1:, :].ravel()])
+    weight = (rng.integers(0, 2 ** 31, len(u), dtype=np.int64) << 32) | np.arange(len(u), dtype=np.int64)
+    none = np.iinfo(np.int64).max
+
+    # The first round works on the lattice directly: every node's cheapest
+    # edge is the least of its four neighbours'.
+    horizontal = ny * (nx - 1)
+    right, left, down, up = (np.full((ny, nx), none, dtype=np.int64) for _ in range(4))
+    right[:, :-1] = left[:, 1:] = weight[:horizontal].reshape(ny, nx - 1)
+    down[:-1] = up[1:] = weight[horizontal:].reshape(ny - 1, nx)
+    best = np.minimum(np.minimum(right, left), np.minimum(down, up))
+    step = np.where(best == right, 1, np.where(best == left, -1, np.where(best == down, nx, -nx)))
+    best = best.ravel()
+    other = (node + step).ravel().astype(np.int32)
+    count = n
+    while True:
+        chosen[best & 0xffffffff] = True
+        # Each component points at the one its cheapest edge reaches. Two
+        # components that picked the same edge point at each other; the
+        # lower one becomes the root so that the pointers form trees.
+        component = np.arange(count, dtype=np.int32)
+        parent = np.where((other[other] == component) & (component < other), component, other)
+        while True:
+            jumped = parent[parent]
+            if (jumped == parent).all():
+                break
+            parent = jumped
+        roots = parent == component
+        label = (np.cumsum(roots, dtype=np.int32) - 1)[parent]
+        count = int(roots.sum())
+        if count == 1:
+            return chosen
+        u, v = label[u], label[v]
+        crossing = u != v
+        u, v, weight = u[crossing], v[crossing], weight[crossing]
+        best = np.full(count, none, dtype=np.int64)
+        np.minimum.at(best, u, weight)
+        np.minimum.at(best, v, weight)
+        other = np.empty(count, dtype=np.int32)
+        hit = weight == best[u]
+        other[u[hit]] = v[hit]
+        hit = weight == best[v]
+        other[v[hit]] = u[hit]
+
+
+def frontier_tree(ny, nx, rng, batch=PRIM_BATCH):
+    # Random spanning tree of the ny x nx node lattice grown outwards from a
+    # random node, in the same edge layout as spanning_tree. This is
+    # randomised Prim: a frontier node picked at random joins the tree
+    # through a random neighbour already in it, and its outside neighbours
+    # join the frontier. To run in whole-array steps, each round a random
+    # `batch` fraction of the frontier (at least one node) joins at once.
+    # Every joining node attaches only to nodes that were in the tree
+    # before the round, so the result is still a tree, and for small
+    # batches it keeps Prim's short branching dead ends.
+    n = ny * nx
+    horizontal = ny * (nx - 1)
+    chosen = np.zeros(horizontal + (ny - 1) * nx, dtype=np.bool_)
+    if n < 2:
+        return chosen
+    in_tree = np.zeros(n, dtype=np.bool_)
+    # queued[i] is the frontier position a node was added at, or -1.
+    queued = np.full(n, -1, dtype=np.int64)
+    frontier = np.array([rng.integers(n)], dtype=np.int64)
+    queued[frontier] = 0
+    steps = np.array([1, -1, nx, -nx])[:, None]
+    while len(frontier):
+        joining = rng.random(len(frontier)) < batch
+        if not joining.any():
+            joining[rng.integers(len(frontier))] = True
+        nodes, frontier = frontier[joining], frontier[~joining]
+        col = nodes % nx
+        inside = np.stack((col < nx - 1, col > 0, nodes < n - nx, nodes >= nx))
+        neighbours = np.where(inside, nodes + steps, 0)
+        # A random key per direction, -1 where no tree node lies that way;
+        # only the very first node has none.
+        keys = rng.random(inside.shape)
+        keys[~(inside & in_tree[neighbours])] = -1
+        way = keys.argmax(axis=0)
+        index = np.arange(len(nodes))
+        attached = keys[way, index] >= 0
+        low = np.minimum(nodes, neighbours[way, index])
+        edge = np.where(way < 2, low // nx * (nx - 1) + low % nx, horizontal + low)
+        chosen[edge[attached]] = True
+        in_tree[nodes] = True
+        # Outside neighbours join the frontier once, even when several
+        # joining nodes share them.
+        new = neighbours[inside & (queued[neighbours] < 0)]
+        queued[new] = np.arange(len(new))
+        new = new[queued[new] == np.arange(len(new))]
+        frontier = np.concatenate([frontier, new])
+    return chosen
+
+
+def _carve(rows, cols, rng, tree):
+    # Passage nodes on odd cells, with the walls of the tree's edges
+    # knocked out.
+    blocked = np.ones((rows, cols), dtype=np.bool_)
+    ny, nx = _node_cells(rows, cols)
+    if not ny or not nx:
+        return blocked
+    chosen = tree(ny, nx, rng)
+    horizontal = ny * (nx - 1)
+    blocked[1:2 * ny:2, 1:2 * nx:2] = False
+    blocked[1:2 * ny:2, 2:2 * nx - 1:2] = ~chosen[:horizontal].reshape(ny, nx - 1)
+    blocked[2:2 * ny - 1:2, 1:2 * nx:2] = ~chosen[horizontal:].reshape(ny - 1, nx)
+    return blocked
+
+
+def kruskal(rows, cols, rng):
+    # Randomised Kruskal maze: a uniformly weighted random spanning tree of
+    # the passage nodes, with the walls of its edges knocked out. The tree
+    # is built with Boruvka's algorithm rather than a sorted edge list and
+    # union-find, which gives the same tree for the same weights but runs
+    # in whole-array NumPy steps.
+    return _carve(rows, cols, rng, spanning_tree)
+
+
+def prim(rows, cols, rng):
+    # Randomised Prim maze: the tree grows out from one node, which gives
+    # more and shorter dead ends than Kruskal and passages that radiate
+    # from the start.
+    return _carve(rows, cols, rng, frontier_tree)
+
+
+def cellular(rows, cols, rng, fill=CAVE_FILL, smoothing=CAVE_SMOOTHING):
+    # Cave map from a cellular automaton: cells start blocked with
+    # probability `fill`, then every smoothing pass blocks a cell when at
+    # least five of the nine cells around and including it are blocked.
+    # Outside the map counts as blocked, so caves close at the border. Not
+    # a perfect maze: some caves may be cut off from the rest.
+    blocked = rng.random((rows, cols)) < fill
+    for _ in range(smoothing):
+        padded = np.pad(blocked, 1, constant_values=True).astype(np.uint8)
+        rows_sum = padded[:-2] + padded[1:-1] + padded[2:]
+        blocked = rows_sum[:, :-2] + rows_sum[:, 1:-1] + rows_sum[:, 2:] >= 5
+    return blocked
+
+
+# Maze algorithms by name. backtracker runs in Python with a random.Random
+# and is kept for the layouts existing seeds already produce; the others
+# are vectorised and take a NumPy Generator.
+ALGORITHMS = {
+    'backtracker': backtracker,
+    'kruskal': kruskal,
+    'prim': prim,
+    'cellular': cellular,
+}
+DEFAULT_ALGORITHM = 'backtracker'
+
+
+def maze_cells(rows, cols, algorithm=DEFAULT_ALGORITHM, seed=None):
+    # Blocked cells of a seeded maze of any size, as a rows x cols bool array.
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"unknown maze algorithm {algorithm!r}, expected one of {', '.join(ALGORITHMS)}")
+    if algorithm == 'backtracker':
+        return backtracker(rows, cols, random.Random(seed))
+    return ALGORITHMS[algorithm](rows, cols, np.random.default_rng(seed))
+
+
+def maze_grid(seed=None, cell_size=CELL_SIZE, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, algorithm=DEFAULT_ALGORITHM):
+    # Occupancy grid (grid[y, x], True for walls) of a seeded maze, in the
+    # same format as occupancy.load_occupancy_grid.
+    cells = maze_cells(height // cell_size, width // cell_size, algorithm, seed)
+    return occupancy.cells_to_grid(cells, cell_size, width, height)
@@ -0,0 +1,258 @@
+import math
+import random
+
+import numpy as np
+
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+INFO_DISPLAY_HEIGHT = 50
+
+OBSTACLE_COLOR_THRESHOLD = (200, 200, 200)
+LUMINANCE_WEIGHTS = (0.299, 0.587, 0.114)
+MAX_CLEARANCE_PX = 32
+
+# 'tuple' keeps the original `(r, g, b) < threshold` lexicographic comparison,
+# 'channels' marks a pixel as blocked when any channel is under its threshold
+# and 'luminance' compares the weighted brightness against a single value.
+THRESHOLD_MODES = ('tuple', 'channels', 'luminance')
+
+
+def obstacle_mask(rgb, threshold=OBSTACLE_COLOR_THRESHOLD, mode='tuple'):
+    if mode not in THRESHOLD_MODES:
+        raise ValueError(f"unknown threshold mode {mode!r}, expected one of {THRESHOLD_MODES}")
+    rgb = np.asarray(rgb)
+    if mode == 'luminance':
+        level = threshold if np.isscalar(threshold) else float(np.dot(threshold, LUMINANCE_WEIGHTS))
+        luminance = rgb[..., :3].astype(np.float32) @ np.asarray(LUMINANCE_WEIGHTS, dtype=np.float32)
+        return luminance < level
+
+    r, g, b = (rgb[..., i].astype(np.int16) for i in range(3))
+    tr, tg, tb = (threshold,) * 3 if np.isscalar(threshold) else threshold
+    if mode == 'channels':
+        return (r < tr) | (g < tg) | (b < tb)
+    return (r < tr) | ((r == tr) & ((g < tg) | ((g == tg) & (b < tb))))
+
+
+def load_occupancy_grid(image_path, width=SCREEN_WIDTH, height=SCREEN_HEIGHT,
+                        threshold=OBSTACLE_COLOR_THRESHOLD, mode='tuple', top_margin=INFO_DISPLAY_HEIGHT):
+    # Imported here so that headless runs on mazes never load PIL.
+    from PIL import Image
+
+    image = Image.open(image_path).convert('RGB')
+    image = image.resize((width, height))
+
+    # Indexed as grid[y, x]; True marks an obstacle pixel.
+    grid = obstacle_mask(np.asarray(image), threshold, mode)
+    grid[:top_margin] = False
+    return grid
+
+
+def box_collides(grid, left, top, width, height):
+    # The map's edge is a wall, as it is for the range sensors: a box that
+    # reaches past it collides.
+    height_px, width_px = grid.shape
+    if left < 0 or top < 0 or left + width > width_px or top + height > height_px:
+        return True
+    return bool(grid[top:top + height, left:left + width].any())
+
+
+def footprint_collides(grid, x, y, radius):
+    # Same square footprint the drones used with pygame.Rect, so the cost of
+    # a query depends on the drone size and not on the size of the map. The
+    # corner is floored, as lookup does, so both agree left of and above the
+    # map too.
+    return box_collides(grid, math.floor(x - radius), math.floor(y - radius), radius * 2, radius * 2)
+
+
+def integral_image(grid, pad=0, fill=False):
+    # Summed-area table with `pad` pixels of `fill` around the grid, so box
+    # sums near the edges need no clipping.
+    padded = np.pad(grid, pad, constant_values=fill) if pad else grid
+    table = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(padded, axis=0, dtype=np.int32), axis=1, out=table[1:, 1:])
+    return table
+
+
+def footprint_free_mask(grid, radius, margin=0):
+    # True where a footprint of half-size radius + margin centred on the
+    # pixel touches no obstacle and stays on the map, for every pixel at
+    # once.
+    half = int(radius) + margin
+    table = integral_image(grid, half, fill=True)
+    height, width = grid.shape
+    size = 2 * half
+    blocked = (table[size:size + height, size:size + width] - table[:height, size:size + width]
+               - table[size:size + height, :width] + table[:height, :width])
+    return blocked == 0
+
+
+def collision_free_mask(grid, radius):
+    # footprint_free_mask over the grid padded by a full footprint of wall,
+    # so that lookups off the map are blocked, as box_collides reports.
+    pad = 2 * int(radius)
+    return footprint_free_mask(np.pad(grid, pad, constant_values=True), radius), pad
+
+
+def lookup(free, x, y):
+    mask, pad = free
+    height, width = mask.shape
+    # A drone at a float position occupies the footprint of pixel
+    # (floor(x), floor(y)); beyond the padding every footprint is blocked.
+    col = np.clip(np.floor(x).astype(np.int64) + pad, 0, width - 1)
+    row = np.clip(np.floor(y).astype(np.int64) + pad, 0, height - 1)
+    return mask[row, col]
+
+
+def sweep(free, x0, y0, x1, y1):
+    # Continuous version of lookup for a footprint moving in a straight line
+    # from (x0, y0) to (x1, y1): walks every pixel the footprint's anchor
+    # pixel passes through, in order, and stops at the first one where the
+    # footprint is not free. Returns (hit, t, normal_x, normal_y): t in
+    # [0, 1] is how far along the move the contact happens and the normal
+    # points out of the face that was hit, (0, 0) when the footprint was
+    # already touching at the start. Without a hit t is 1. Scalars or
+    # arrays, one segment per element.
+    #
+    # Pixel boundaries crossed along x and along y are merged by their t
+    # into one sorted list per segment, so the walk is a few array
+    # operations however long the segments are. A single segment is walked
+    # in plain Python, which is cheaper than that many array operations.
+    if all(np.ndim(value) == 0 for value in (x0, y0, x1, y1)):
+        return _sweep_segment(free, float(x0), float(y0), float(x1), float(y1))
+    x0, y0, x1, y1 = np.broadcast_arrays(*(np.asarray(value, dtype=np.float64) for value in (x0, y0, x1, y1)))
+    shape = x0.shape
+    x0, y0, x1, y1 = (value.ravel() for value in (x0, y0, x1, y1))
+    col0, row0 = np.floor(x0), np.floor(y0)
+    dx, dy = x1 - x0, y1 - y0
+    step_x, step_y = np.sign(dx), np.sign(dy)
+    crossings_x = np.abs(np.floor(x1) - col0).astype(np.int64)
+    crossings_y = np.abs(np.floor(y1) - row0).astype(np.int64)
+
+    def crossing_times(origin, start, delta, step, count):
+        # t of the k-th pixel boundary crossed, +inf past the last one.
+        k = np.arange(count.max(initial=0))
+        boundary = start[:, None] + np.where(step > 0, 1, 0)[:, None] + step[:, None] * k
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (boundary - origin[:, None]) / delta[:, None]
+        return np.where(k < count[:, None], t, np.inf)
+
+    times = np.concatenate([crossing_times(x0, col0, dx, step_x, crossings_x),
+                            crossing_times(y0, row0, dy, step_y, crossings_y)], axis=1)
+    along_x = np.arange(times.shape[1]) < crossings_x.max(initial=0)
+    order = np.argsort(times, axis=1, kind='stable')
+    times = np.take_along_axis(times, order, axis=1)
+    is_x = along_x[order]
+    # The anchor pixel after each crossing, with the start pixel in front.
+    cols = col0[:, None] + step_x[:, None] * np.cumsum(is_x, axis=1)
+    rows = row0[:, None] + step_y[:, None] * np.cumsum(~is_x, axis=1)
+    cols = np.concatenate([col0[:, None], cols], axis=1)
+    rows = np.concatenate([row0[:, None], rows], axis=1)
+    times = np.concatenate([np.zeros((len(x0), 1)), times], axis=1)
+    blocked = ~lookup(free, cols, rows) & np.isfinite(times)
+
+    hit = blocked.any(axis=1)
+    first = blocked.argmax(axis=1)
+    index = np.arange(len(x0))
+    t = np.where(hit, times[index, first], 1.0)
+    crossed_x = np.concatenate([np.zeros((len(x0), 1), dtype=np.bool_), is_x], axis=1)[index, first]
+    entered = hit & (first > 0)
+    normal_x = np.where(entered & crossed_x, -step_x, 0.0)
+    normal_y = np.where(entered & ~crossed_x, -step_y, 0.0)
+    return (hit.reshape(shape), t.reshape(shape), normal_x.reshape(shape), normal_y.reshape(shape))
+
+
+def _sweep_segment(free, x0, y0, x1, y1):
+    mask, pad = free
+    height, width = mask.shape
+
+    def blocked(col, row):
+        return not mask[min(max(row + pad, 0), height - 1), min(max(col + pad, 0), width - 1)]
+
+    col, row = math.floor(x0), math.floor(y0)
+    if blocked(col, row):
+        return True, 0.0, 0.0, 0.0
+    dx, dy = x1 - x0, y1 - y0
+    step_x, step_y = (dx > 0) - (dx < 0), (dy > 0) - (dy < 0)
+    left_x, left_y = abs(math.floor(x1) - col), abs(math.floor(y1) - row)
+    while left_x or left_y:
+        # Same order as the batched walk: on a tie the x boundary comes first.
+        t_x = (col + (step_x > 0) - x0) / dx if left_x else math.inf
+        t_y = (row + (step_y > 0) - y0) / dy if left_y else math.inf
+        if t_x <= t_y:
+            col, t, normal, left_x = col + step_x, t_x, (-step_x, 0.0), left_x - 1
+        else:
+            row, t, normal, left_y = row + step_y, t_y, (0.0, -step_y), left_y - 1
+        if blocked(col, row):
+            return True, t, float(normal[0]), float(normal[1])
+    return False, 1.0, 0.0, 0.0
+
+
+def cells_to_grid(blocked_cells, cell_size, width=None, height=None):
+    blocked_cells = np.asarray(blocked_cells, dtype=np.bool_)
+    grid = np.repeat(np.repeat(blocked_cells, cell_size, axis=0), cell_size, axis=1)
+    if width is not None or height is not None:
+        padded = np.zeros((height or grid.shape[0], width or grid.shape[1]), dtype=np.bool_)
+        rows, cols = min(padded.shape[0], grid.shape[0]), min(padded.shape[1], grid.shape[1])
+        padded[:rows, :cols] = grid[:rows, :cols]
+        grid = padded
+    return grid
+
+
+def clearance_map(grid, max_distance=MAX_CLEARANCE_PX):
+    # Euclidean distance from every pixel to the nearest obstacle pixel,
+    # saturated at max_distance. The vertical distance is found per column
+    # with running max/min scans, then combined along each row for every
+    # horizontal offset up to max_distance, which keeps it exact within the
+    # cap while staying fully vectorised.
+    height, width = grid.shape
+    cap = max_distance + 1
+    rows = np.arange(height, dtype=np.int32)[:, None]
+    above = np.maximum.accumulate(np.where(grid, rows, -cap - height), axis=0)
+    below = np.minimum.accumulate(np.where(grid, rows, cap + 2 * height)[::-1], axis=0)[::-1]
+    vertical = np.minimum(np.minimum(rows - above, below - rows), cap).astype(np.float32)
+
+    vertical_sq = vertical * vertical
+    distance_sq = vertical_sq.copy()
+    for dx in range(1, min(cap, width)):
+        offset = np.float32(dx * dx)
+        np.minimum(distance_sq[:, dx:], vertical_sq[:, :-dx] + offset, out=distance_sq[:, dx:])
+        np.minimum(distance_sq[:, :-dx], vertical_sq[:, dx:] + offset, out=distance_sq[:, :-dx])
+    return np.minimum(np.sqrt(distance_sq), np.float32(max_distance))
+
+
+def clearance_at(clearance, x, y):
+    x, y = int(x), int(y)
+    if not (0 <= y < clearance.shape[0] and 0 <= x < clearance.shape[1]):
+        return 0.0
+    return float(clearance[y, x])
+
+
+def spawn_mask(clearance, radius, bounds=None):
+    # The collision footprint is a square of half-size `radius`, whose corner
+    # pixels sit radius * sqrt(2) from the centre, so that is the clearance a
+    # spawn point needs to be guaranteed collision free.
+    mask = clearance > radius * math.sqrt(2)
+    if bounds is not None:
+        left, top, right, bottom = bounds
+        window = np.zeros_like(mask)
+        window[max(top, 0):bottom + 1, max(left, 0):right + 1] = True
+        mask &= window
+    return mask
+
+
+def sample_free_positions(clearance, radius, count=1, bounds=None, rng=random):
+    candidates = np.flatnonzero(spawn_mask(clearance, radius, bounds))
+    if len(candidates) < count:
+        raise ValueError(f"only {len(candidates)} free positions for a drone of radius {radius}, asked for {count}")
+    width = clearance.shape[1]
+    picks = candidates[rng.sample(range(len(candidates)), count)]
+    return [(int(i % width), int(i // width)) for i in picks]
+
+
+def grid_to_surface(grid, color=(0, 0, 0), background=(255, 255, 255)):
+    import pygame
+
+    pixels = np.empty(grid.shape[::-1] + (3,), dtype=np.uint8)
+    pixels[...] = background
+    pixels[grid.T] = color
+    return pygame.surfarray.make_surface(pixels)
@@ -0,0 +1,157 @@
+from collections import deque
+
+import numpy as np
+
+CHUNK_POINTS = 4096
+COMPACT_TOLERANCE_PX = 1.0
+
+
+class PathBuffer:
+    # A flown path as integer pixel coordinates, stored in fixed-size int32
+    # chunks instead of a list of tuples. A point equal to the last one is
+    # not stored again, so hovering costs nothing.
+    #
+    # With max_points set, a buffer that already holds that many points when
+    # it starts a new chunk first simplifies the chunks it has not
+    # simplified yet with Douglas-Peucker, each to within `tolerance` pixels
+    # and keeping its ends, and only drops its oldest chunks while that is
+    # not enough. Each chunk is simplified once, on its own, so a buffer
+    # depends only on the points appended to it and from_array() of the
+    # same points builds the same buffer.
+    #
+    # `appended` counts every point ever stored, simplified or dropped ones
+    # included, so a consumer can remember where it stopped reading and ask
+    # for only what came after with since().
+
+    def __init__(self, points=(), chunk_points=CHUNK_POINTS, max_points=None, tolerance=COMPACT_TOLERANCE_PX):
+        self.chunk_points = chunk_points
+        self.max_points = max_points
+        self.tolerance = tolerance
+        self.chunks = deque()
+        self.simplified = 0  # leading chunks already simplified
+        self.fill = chunk_points  # points used in the last chunk
+        self.dropped = 0  # points no longer retained
+        self.appended = 0
+        self.last = None
+        self._array = None
+        for x, y in points:
+            self.append(x, y)
+
+    @classmethod
+    def from_array(cls, points, chunk_points=CHUNK_POINTS, max_points=None, tolerance=COMPACT_TOLERANCE_PX):
+        # Bulk-loads points that are already free of repeats, such as the
+        # array() of another buffer, a chunk at a time.
+        buffer = cls(chunk_points=chunk_points, max_points=max_points, tolerance=tolerance)
+        points = np.asarray(points, dtype=np.int32).reshape(-1, 2)
+        for start in range(0, len(points), chunk_points):
+            part = points[start:start + chunk_points]
+            buffer._new_chunk()
+            buffer.chunks[-1][:len(part)] = part
+            buffer.fill = len(part)
+            buffer.appended += len(part)
+        buffer.last = tuple(points[-1].tolist()) if len(points) else None
+        return buffer
+
+    def append(self, x, y):
+        point = (int(x), int(y))
+        if point == self.last:
+            return
+        if self.fill == self.chunk_points:
+            self._new_chunk()
+        self.chunks[-1][self.fill] = point
+        self.fill += 1
+        self.appended += 1
+        self.last = point
+        self._array = None
+
+    def _new_chunk(self):
+        if self.max_points is not None and len(self) >= self.max_points:
+            self._compact()
+        self.chunks.append(np.empty((self.chunk_points, 2), dtype=np.int32))
+        self.fill = 0
+
+    def _compact(self):
+        # Every chunk is full here. A chunk is simplified from the last point
+        # of the one before, which is kept, so the joins are simplified too.
+        for index in range(self.simplified, len(self.chunks)):
+            chunk = self.chunks[index]
+            if index:
+                kept = douglas_peucker(np.concatenate([self.chunks[index - 1][-1:], chunk]), self.tolerance)[1:]
+            else:
+                kept = douglas_peucker(chunk, self.tolerance)
+            self.dropped += len(chunk) - len(kept)
+            self.chunks[index] = kept
+        self.simplified = len(self.chunks)
+        while self.chunks and len(self) >= self.max_points:
+            self.dropped += len(self.chunks.popleft())
+            self.simplified -= 1
+        self._array = None
+
+    def __len__(self):
+        return self.appended - self.dropped
+
+    def array(self):
+        # All retained points as an (N, 2) int32 array, cached until the next
+        # append.
+        if self._array is None:
+            if not self.chunks:
+                self._array = np.empty((0, 2), dtype=np.int32)
+            else:
+                parts = list(self.chunks)
+                parts[-1] = parts[-1][:self.fill]
+                self._array = np.concatenate(parts)
+        return self._array
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.array()
+        return array if dtype is None else array.astype(dtype)
+
+    def __iter__(self):
+        return iter(map(tuple, self.array().tolist()))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [tuple(point) for point in self.array()[index].tolist()]
+        return tuple(self.array()[index].tolist())
+
+    def since(self, appended):
+        # Points stored after the first `appended` ones, as far as they are
+        # still retained. Simplifying never removes the newest point or any
+        # after it, so a consumer that reads after every append gets every
+        # point.
+        return self.array()[max(appended - self.dropped, 0):]
+
+    def decimated(self, tolerance=1.0):
+        return douglas_peucker(self.array(), tolerance)
+
+
+def douglas_peucker(points, tolerance):
+    # Keeps the fewest points such that no dropped point lies further than
+    # `tolerance` from the polyline through the kept ones. Iterative, with
+    # the distances of each span measured in one vectorised pass.
+    points = np.asarray(points)
+    if len(points) <= 2:
+        return points
+    coords = points.astype(np.float64)
+    keep = np.zeros(len(points), dtype=np.bool_)
+    keep[0] = keep[-1] = True
+    spans = [(0, len(points) - 1)]
+    while spans:
+        first, last = spans.pop()
+        if last - first < 2:
+            continue
+        start, end = coords[first], coords[last]
+        inner = coords[first + 1:last]
+        direction = end - start
+        length = np.hypot(*direction)
+        if length == 0:
+            distance = np.hypot(*(inner - start).T)
+        else:
+            distance = np.abs(direction[0] * (inner[:, 1] - start[1]) - direction[1] * (inner[:, 0] - start[0])) / length
+        farthest = int(distance.argmax())
+        if distance[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            spans.append((first, split))
+            spans.append((split, last))
+    return points[keep]
@@ -0,0 +1,311 @@
+import heapq
+import math
+
+import numpy as np
+
+import occupancy
+
+PLAN_MODES = ('retrace', 'shortest')
+SQRT2 = math.sqrt(2)
+SEGMENT_SAMPLE_PX = 0.25
+
+NEIGHBOR_STEPS = ((1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+                  (1, 1, SQRT2), (1, -1, SQRT2), (-1, 1, SQRT2), (-1, -1, SQRT2))
+
+
+def safe_pixels(grid, radius):
+    # Pixels where the drone's square footprint fits without touching a wall.
+    # A float position can floor onto a footprint one pixel further out than
+    # its rounded centre, hence the extra pixel of margin.
+    return occupancy.footprint_free_mask(grid, radius, margin=1)
+
+
+def planning_lattice(safe, cell_size):
+    # Plan on a coarse lattice of cell centres. A node is passable when the
+    # drone fits at its centre and an edge is usable when every pixel on the
+    # straight line between the two centres is safe.
+    offset = cell_size // 2
+    nodes = safe[offset::cell_size, offset::cell_size]
+    rows, cols = nodes.shape
+    padded = np.zeros((safe.shape[0] + 2 * cell_size, safe.shape[1] + 2 * cell_size), dtype=np.bool_)
+    padded[cell_size:-cell_size, cell_size:-cell_size] = safe
+
+    edges = []
+    for dx, dy, _ in NEIGHBOR_STEPS:
+        edge = np.ones((rows, cols), dtype=np.bool_)
+        for t in range(cell_size + 1):
+            top = cell_size + offset + t * dy
+            left = cell_size + offset + t * dx
+            edge &= padded[top:top + rows * cell_size:cell_size, left:left + cols * cell_size:cell_size]
+        edges.append(edge)
+    return nodes, edges
+
+
+def flown_corridor(paths, shape, cell_size, width=1):
+    # Cells covered by a set of polylines, grown by `width` cells. Segments
+    # are sampled at half a cell, so decimated paths with long straight
+    # runs cover every cell they pass through.
+    corridor = np.zeros(shape, dtype=np.bool_)
+    for path in paths:
+        points = np.asarray(path, dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0:
+            continue
+        points = np.concatenate([sample_polyline(points, cell_size / 2), points])
+        cells = np.floor(points / cell_size).astype(np.int64)
+        inside = (cells[:, 0] >= 0) & (cells[:, 0] < shape[1]) & (cells[:, 1] >= 0) & (cells[:, 1] < shape[0])
+        cells = cells[inside]
+        corridor[cells[:, 1], cells[:, 0]] = True
+    for _ in range(width):
+        grown = corridor.copy()
+        grown[1:] |= corridor[:-1]
+        grown[:-1] |= corridor[1:]
+        grown[:, 1:] |= corridor[:, :-1]
+        grown[:, :-1] |= corridor[:, 1:]
+        corridor = grown
+    return corridor
+
+
+def flown_mask(paths, shape, cell_size):
+    # The pixels, in a mask of the given shape, of the cells a set of
+    # polylines passes through or borders.
+    cells = (-(-shape[0] // cell_size), -(-shape[1] // cell_size))
+    return occupancy.cells_to_grid(flown_corridor(paths, cells, cell_size), cell_size, shape[1], shape[0])
+
+
+def sample_polyline(points, spacing):
+    # Points along every segment of the polyline, at most `spacing` apart.
+    if len(points) < 2:
+        return points
+    segments = np.diff(points, axis=0)
+    counts = np.ceil(np.hypot(segments[:, 0], segments[:, 1]) / spacing).astype(np.int64) + 1
+    index = np.repeat(np.arange(len(segments)), counts)
+    step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    fraction = step / np.maximum(counts - 1, 1)[index]
+    return points[index] + segments[index] * fraction[:, None]
+
+
+def segment_clear(free, start, end):
+    # `free` is a footprint-free mask without margin. A drone at a float
+    # position (x, y) occupies exactly the footprint of pixel
+    # (floor(x), floor(y)), so sampling the segment finely and flooring the
+    # samples checks every position the drone can stop at along it.
+    (x0, y0), (x1, y1) = start, end
+    samples = int(math.ceil(math.hypot(x1 - x0, y1 - y0) / SEGMENT_SAMPLE_PX)) + 1
+    xs = np.floor(np.linspace(x0, x1, samples)).astype(np.int64)
+    ys = np.floor(np.linspace(y0, y1, samples)).astype(np.int64)
+    height, width = free.shape
+    if xs.min() < 0 or ys.min() < 0 or xs.max() >= width or ys.max() >= height:
+        return False
+    return bool(free[ys, xs].all())
+
+
+def cell_center(cell, cell_size):
+    offset = cell_size // 2
+    return cell[0] * cell_size + offset, cell[1] * cell_size + offset
+
+
+def links(free, point, nodes, cell_size):
+    # Lattice nodes around an off-lattice point that it can fly straight to,
+    # as (index, cost) pairs with the cost in cells.
+    rows, cols = nodes.shape
+    cx, cy = _cell_of(point, cell_size, nodes.shape)
+    linked = []
+    for nx in range(cx - 1, cx + 2):
+        for ny in range(cy - 1, cy + 2):
+            if not (0 <= nx < cols and 0 <= ny < rows) or not nodes[ny, nx]:
+                continue
+            center = cell_center((nx, ny), cell_size)
+            if segment_clear(free, point, center):
+                linked.append((ny * cols + nx, math.hypot(center[0] - point[0], center[1] - point[1]) / cell_size))
+    return linked
+
+
+def astar(nodes, edges, start, goal, start_links, goal_links):
+    # start and goal are lattice cells, but the drone leaves from and arrives
+    # at off-lattice points inside them, which connect to the lattice only
+    # through start_links and goal_links.
+    rows, cols = nodes.shape
+    usable = [edge.ravel().tolist() for edge in edges]
+    steps = [(dy * cols + dx, cost) for dx, dy, cost in NEIGHBOR_STEPS]
+    start_index = start[1] * cols + start[0]
+    goal_index = goal[1] * cols + goal[0]
+    goal_costs = dict(goal_links)
+    gx, gy = goal
+
+    best = {start_index: 0.0}
+    parent = {start_index: None}
+    heap = [(0.0, 0.0, start_index)]
+    while heap:
+        _, cost, index = heapq.heappop(heap)
+        if index == goal_index:
+            cells = []
+            while index is not None:
+                cells.append((index % cols, index // cols))
+                index = parent[index]
+            return cells[::-1]
+        if cost > best[index]:
+            continue
+
+        if index == start_index:
+            moves = start_links
+        else:
+            moves = [(index + delta, step) for direction, (delta, step) in enumerate(steps)
+                     if usable[direction][index] and index + delta != goal_index]
+            if index in goal_costs:
+                moves.append((goal_index, goal_costs[index]))
+        for neighbor, step in moves:
+            new_cost = cost + step
+            if new_cost < best.get(neighbor, math.inf):
+                best[neighbor] = new_cost
+                parent[neighbor] = index
+                hx, hy = abs(neighbor % cols - gx), abs(neighbor // cols - gy)
+                heuristic = max(hx, hy) + (SQRT2 - 1) * min(hx, hy)
+                heapq.heappush(heap, (new_cost + heuristic, new_cost, neighbor))
+    return None
+
+
+def smooth_path(points, free):
+    if len(points) <= 2:
+        return list(points)
+    smoothed = [points[0]]
+    anchor = 0
+    for index in range(2, len(points)):
+        # Keep extending the straight segment from the anchor until the next
+        # point is no longer visible, then pin the last visible one.
+        if not segment_clear(free, points[anchor], points[index]):
+            anchor = index - 1
+            smoothed.append(points[anchor])
+    smoothed.append(points[-1])
+    return smoothed
+
+
+def plan_path(grid, start, goal, radius, cell_size=None, mode='shortest', flown_path=None):
+    if mode not in PLAN_MODES:
+        raise ValueError(f"unknown planning mode {mode!r}, expected one of {PLAN_MODES}")
+    cell_size = cell_size or max(2 * int(radius), 1)
+    start, goal = tuple(start), tuple(goal)
+    safe = safe_pixels(grid, radius)
+    free = occupancy.footprint_free_mask(grid, radius)
+    if mode == 'retrace':
+        # Only fly back through cells the drone has already been through.
+        flown = flown_path if flown_path is not None else []
+        corridor = flown_mask([flown, [start], [goal]], safe.shape, cell_size)
+        safe &= corridor
+        free &= corridor
+    if segment_clear(free, start, goal):
+        return [start, goal]
+
+    nodes, edges = planning_lattice(safe, cell_size)
+    start_cell = _cell_of(start, cell_size, nodes.shape)
+    goal_cell = _cell_of(goal, cell_size, nodes.shape)
+    if start_cell == goal_cell:
+        return None
+    goal_index = goal_cell[1] * nodes.shape[1] + goal_cell[0]
+    start_links = [(index, cost) for index, cost in links(free, start, nodes, cell_size) if index != goal_index]
+    cells = astar(nodes, edges, start_cell, goal_cell, start_links, links(free, goal, nodes, cell_size))
+    if cells is None:
+        return None
+
+    points = [start] + [cell_center(cell, cell_size) for cell in cells[1:-1]] + [goal]
+    return smooth_path(points, free)
+
+
+def flood(nodes, edges, source, source_links):
+    # Dijkstra from the source over the lattice. Returns the distance of
+    # every cell in cells (inf where unreachable) and, for every reached
+    # cell, the index of the next cell on its shortest way to the source.
+    rows, cols = nodes.shape
+    usable = [edge.ravel().tolist() for edge in edges]
+    steps = [(dy * cols + dx, cost) for dx, dy, cost in NEIGHBOR_STEPS]
+    source_index = source[1] * cols + source[0]
+
+    distance = [math.inf] * (rows * cols)
+    toward = [-1] * (rows * cols)
+    distance[source_index] = 0.0
+    toward[source_index] = source_index
+    heap = [(0.0, source_index)]
+    while heap:
+        cost, index = heapq.heappop(heap)
+        if cost > distance[index]:
+            continue
+        if index == source_index:
+            moves = source_links
+        else:
+            moves = [(index + delta, step) for direction, (delta, step) in enumerate(steps)
+                     if usable[direction][index]]
+        for neighbor, step in moves:
+            new_cost = cost + step
+            if new_cost < distance[neighbor]:
+                distance[neighbor] = new_cost
+                toward[neighbor] = index
+                heapq.heappush(heap, (new_cost, neighbor))
+    return (np.array(distance, dtype=np.float32).reshape(rows, cols),
+            np.array(toward, dtype=np.int32).reshape(rows, cols))
+
+
+class HomeField:
+    # With flown_path given, the field only covers the cells along it, as
+    # plan_path's 'retrace' mode does.
+
+    def __init__(self, grid, home, radius, cell_size=None, flown_path=None):
+        self.home = (int(home[0]), int(home[1]))
+        self.cell_size = cell_size or max(2 * int(radius), 1)
+        self.free = occupancy.footprint_free_mask(grid, radius)
+        safe = safe_pixels(grid, radius)
+        if flown_path is not None:
+            corridor = flown_mask([flown_path, [self.home]], safe.shape, self.cell_size)
+            safe &= corridor
+            self.free &= corridor
+        nodes, edges = planning_lattice(safe, self.cell_size)
+        self.shape = nodes.shape
+        self.home_cell = _cell_of(self.home, self.cell_size, self.shape)
+        self.distance_cells, self.toward = flood(nodes, edges, self.home_cell,
+                                                 links(self.free, self.home, nodes, self.cell_size))
+
+    def _candidates(self, x, y):
+        # (cost to home, waypoint) for the cells around (x, y) that are
+        # connected to home.
+        cx, cy = int(x) // self.cell_size, int(y) // self.cell_size
+        rows, cols = self.shape
+        for nx in range(cx - 1, cx + 2):
+            for ny in range(cy - 1, cy + 2):
+                if (nx, ny) == self.home_cell:
+                    yield math.hypot(x - self.home[0], y - self.home[1]), self.home
+                elif 0 <= nx < cols and 0 <= ny < rows and self.toward[ny, nx] >= 0:
+                    center = cell_center((nx, ny), self.cell_size)
+                    cost = (float(self.distance_cells[ny, nx]) * self.cell_size
+                            + math.hypot(x - center[0], y - center[1]))
+                    yield cost, center
+
+    def distance(self, x, y):
+        # Remaining path length to home in pixels, inf when out of reach.
+        return min((cost for cost, _ in self._candidates(x, y)), default=math.inf)
+
+    def next_waypoint(self, x, y):
+        if _same_point((x, y), self.home):
+            return self.home
+        cell = (int(round(x)) // self.cell_size, int(round(y)) // self.cell_size)
+        rows, cols = self.shape
+        if (_same_point((x, y), cell_center(cell, self.cell_size)) and 0 <= cell[0] < cols and 0 <= cell[1] < rows
+                and self.toward[cell[1], cell[0]] >= 0 and cell != self.home_cell):
+            # On the lattice: one step down the field.
+            next_index = int(self.toward[cell[1], cell[0]])
+            next_cell = (next_index % cols, next_index // cols)
+            return self.home if next_cell == self.home_cell else cell_center(next_cell, self.cell_size)
+
+        # Off the lattice: head for the best nearby cell in straight reach.
+        for _, waypoint in sorted(self._candidates(x, y)):
+            if segment_clear(self.free, (x, y), waypoint):
+                return waypoint
+        return None
+
+
+def _same_point(a, b):
+    # Positions integrated from velocities pick up float noise.
+    return abs(a[0] - b[0]) < 1e-6 and abs(a[1] - b[1]) < 1e-6
+
+
+def _cell_of(point, cell_size, shape):
+    x = min(max(int(point[0]) // cell_size, 0), shape[1] - 1)
+    y = min(max(int(point[1]) // cell_size, 0), shape[0] - 1)
+    return x, y
@@ -0,0 +1,165 @@
+import json
+import os
+import time
+
+import numpy as np
+
+DEFAULT_DIR = 'profiles'
+WINDOW_FRAMES = 600  # ten seconds of frames at the tick rate
+EXPORT_EVERY_FRAMES = 600
+# Histogram bucket edges in milliseconds; the last bucket catches the rest.
+HISTOGRAM_EDGES_MS = (0, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 33, 66, 1000)
+
+
+def default_path(directory=None):
+    directory = directory or os.environ.get('DRONE_PROFILE_DIR', DEFAULT_DIR)
+    return os.path.join(directory, time.strftime('profile-%Y%m%d-%H%M%S.jsonl'))
+
+
+def from_env():
+    # The games profile when DRONE_PROFILE or DRONE_PROFILE_DIR is set, and
+    # export histograms only when DRONE_PROFILE_DIR says where to.
+    enabled = bool(os.environ.get('DRONE_PROFILE') or os.environ.get('DRONE_PROFILE_DIR'))
+    export_path = default_path() if enabled and os.environ.get('DRONE_PROFILE_DIR') else None
+    return Profiler(enabled, export_path=export_path)
+
+
+class _Span:
+    __slots__ = ('totals', 'name', 'started')
+
+    def __init__(self, totals, name):
+        self.totals = totals
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.totals[self.name] = self.totals.get(self.name, 0.0) + time.perf_counter() - self.started
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    # Named timing spans around the stages of a main loop, kept per frame in
+    # rolling windows of the last `window` frames. A span costs two
+    # perf_counter calls and a dict update; a disabled profiler hands out
+    # one shared no-op span and end_frame returns at once, so the hooks can
+    # stay in the loops for good.
+    #
+    # Stages nest freely (a 'draw' span may contain a 'trail' span) and are
+    # reported side by side. With an export_path, a summary with histograms
+    # of every stage is appended as a JSON line every export_every frames
+    # and on close().
+
+    def __init__(self, enabled=True, window=WINDOW_FRAMES, export_path=None, export_every=EXPORT_EVERY_FRAMES):
+        self.enabled = enabled
+        self.window = window
+        self.export_path = export_path
+        self.export_every = export_every
+        self.frames = 0
+        self.frame_seconds = np.zeros(window)
+        self.frame_ticks = np.zeros(window, dtype=np.int64)
+        self.stages = {}
+        self._spans = {}
+        self._totals = {}
+        self._ticks = 0
+        self._frame_started = None
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        span = self._spans.get(name)
+        if span is None:
+            span = self._spans[name] = _Span(self._totals, name)
+        return span
+
+    def tick(self, count=1):
+        # Counts simulation ticks advanced during this frame.
+        self._ticks += count
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        slot = self.frames % self.window
+        for name, seconds in self._totals.items():
+            if name not in self.stages:
+                self.stages[name] = np.zeros(self.window)
+        for name, history in self.stages.items():
+            history[slot] = self._totals.get(name, 0.0)
+        self._totals.clear()
+        self.frame_seconds[slot] = now - self._frame_started if self._frame_started is not None else 0.0
+        self.frame_ticks[slot] = self._ticks
+        self._ticks = 0
+        self._frame_started = now
+        self.frames += 1
+        if self.export_path is not None and self.frames % self.export_every == 0:
+            self.export()
+
+    def _filled(self):
+        return min(self.frames, self.window)
+
+    def rates(self):
+        # Frames and simulation ticks per second over the window.
+        filled = self._filled()
+        elapsed = self.frame_seconds[:filled].sum()
+        if not elapsed:
+            return 0.0, 0.0
+        return filled / elapsed, self.frame_ticks[:filled].sum() / elapsed
+
+    def summary(self):
+        # Mean, 95th percentile and worst milliseconds per stage and frame.
+        filled = self._filled()
+        stages = {}
+        for name, history in self.stages.items():
+            ms = history[:filled] * 1e3
+            stages[name] = {'mean_ms': float(ms.mean()), 'p95_ms': float(np.percentile(ms, 95)),
+                            'max_ms': float(ms.max())}
+        return stages
+
+    def histograms(self, edges_ms=HISTOGRAM_EDGES_MS):
+        # Frame counts per bucket of stage time over the window.
+        filled = self._filled()
+        return {name: np.histogram(history[:filled] * 1e3, edges_ms)[0].tolist()
+                for name, history in self.stages.items()}
+
+    def export(self, path=None):
+        path = path or self.export_path
+        if not self.frames:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fps, ticks_per_sec = self.rates()
+        summary = self.summary()
+        for name, counts in self.histograms().items():
+            summary[name]['histogram'] = counts
+        record = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'frames': self.frames,
+            'window': self._filled(),
+            'fps': fps,
+            'ticks_per_sec': ticks_per_sec,
+            'histogram_edges_ms': list(HISTOGRAM_EDGES_MS),
+            'stages': summary,
+        }
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def close(self):
+        if self.enabled and self.export_path is not None and self.frames % self.export_every:
+            self.export()
@@ -0,0 +1,240 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+
+import occupancy
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+MIN_ZOOM = 1 / 64
+MAX_ZOOM = 8
+CACHE_SURFACE_PIXELS = 16 * 800 * 600
+
+
+class MapRenderer:
+    # Draws the static map into a cached surface once and, on every frame,
+    # only repaints the parts of the screen that changed: the areas the
+    # moving things covered last frame are restored from the cache, and only
+    # those and this frame's areas are sent to the display. The cache is
+    # rebuilt when the map changes and the whole screen is repainted after
+    # anything drew over it outside the frame (a message box).
+    #
+    # Trails are persistent: each new stretch is stroked once into a scene
+    # surface that sits on top of the cached map, and dirty areas are
+    # restored from that scene, so a trail never has to be redrawn whole.
+    #
+    # Given the map's merged wall rectangles (walls.wall_rects), the cache is
+    # painted from them instead of being converted from the grid pixel by
+    # pixel.
+
+    def __init__(self, screen, grid, color=BLACK, background=WHITE, walls=None):
+        self.screen = screen
+        self.color = color
+        self.background_color = background
+        self.previous = []
+        self.current = []
+        self.set_grid(grid, walls)
+
+    def set_grid(self, grid, walls=None):
+        self.grid = grid
+        self.walls = walls
+        self.background = None
+        self.scene = None
+        self.invalidate()
+
+    def clear_trails(self):
+        self.scene = None
+        self.invalidate()
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def begin_frame(self):
+        if self.background is None:
+            self.background = self._render_background()
+        if self.scene is None:
+            self.scene = self.background.copy()
+        if self.full_redraw:
+            self.screen.blit(self.scene, (0, 0))
+        else:
+            for rect in self.previous:
+                self.screen.blit(self.scene, rect, rect)
+        self.current = []
+
+    def _render_background(self):
+        if self.walls is None:
+            return occupancy.grid_to_surface(self.grid, self.color, self.background_color).convert()
+        height, width = self.grid.shape
+        surface = pygame.Surface((width, height)).convert()
+        surface.fill(self.background_color)
+        for rect in self.walls.tolist():
+            surface.fill(self.color, rect)
+        return surface
+
+    def draw_trail(self, points, color, width):
+        # Strokes a new stretch of trail into the scene and onto the screen
+        # and returns the screen area it covered.
+        points = [tuple(point) for point in points]
+        pygame.draw.lines(self.scene, color, False, points, width)
+        return pygame.draw.lines(self.screen, color, False, points, width)
+
+    def mark(self, *rects):
+        # Records screen areas drawn this frame, as returned by the
+        # pygame.draw functions and blits.
+        self.current.extend(rect for rect in rects if rect is not None)
+
+    def end_frame(self):
+        if self.full_redraw:
+            pygame.display.flip()
+            self.full_redraw = False
+        else:
+            pygame.display.update(self.previous + self.current)
+        self.previous = self.current
+
+
+class Camera:
+    # A viewport of width x height screen pixels onto map pixels, centred on
+    # (x, y) at `zoom` screen pixels per map pixel. to_screen and to_map take
+    # scalars or arrays.
+
+    def __init__(self, width, height, zoom=1.0, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+        self.width = width
+        self.height = height
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.zoom = min(max(zoom, min_zoom), max_zoom)
+        self.x = self.y = 0.0
+
+    def follow(self, x, y):
+        self.x, self.y = x, y
+
+    def zoom_by(self, factor):
+        self.zoom = min(max(self.zoom * factor, self.min_zoom), self.max_zoom)
+
+    def to_screen(self, x, y):
+        return (x - self.x) * self.zoom + self.width / 2, (y - self.y) * self.zoom + self.height / 2
+
+    def to_map(self, screen_x, screen_y):
+        return (screen_x - self.width / 2) / self.zoom + self.x, (screen_y - self.height / 2) / self.zoom + self.y
+
+    def visible(self):
+        # The map area in view, as left, top, right, bottom.
+        left, top = self.to_map(0, 0)
+        right, bottom = self.to_map(self.width, self.height)
+        return left, top, right, bottom
+
+
+class TiledMapRenderer:
+    # Draws the part of a tiles.TiledMap a Camera looks at. Each visible
+    # tile becomes a surface at the current zoom, kept in an LRU cache
+    # bounded by pixels rather than tiles: whatever the zoom, the tiles in
+    # view add up to about one screen, so scrolling reuses the tiles still
+    # in view and memory does not grow with the map. Zoomed out, tiles are
+    # downsampled before they are turned into surfaces. The view moves
+    # every frame, so every frame is a full redraw.
+
+    def __init__(self, screen, tiled_map, camera, color=BLACK, background=WHITE, cache_pixels=CACHE_SURFACE_PIXELS):
+        self.screen = screen
+        self.map = tiled_map
+        self.camera = camera
+        self.color = color
+        self.background_color = background
+        self.cache_pixels = cache_pixels
+        self.cached_pixels = 0
+        self.surfaces = OrderedDict()
+
+    def _tile_surface(self, row, col, zoom):
+        key = (row, col, zoom)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            tile_size = self.map.tile_size
+            # Tiles on the last row and column are cut to the map's edge.
+            height = min(tile_size, self.map.height - row * tile_size)
+            width = min(tile_size, self.map.width - col * tile_size)
+            step = max(1, 2 ** int(math.log2(1 / zoom))) if zoom < 1 else 1
+            tile = self.map.tile(row, col)[:height:step, :width:step]
+            surface = occupancy.grid_to_surface(tile, self.color, self.background_color)
+            # Sizes are rounded up to whole pixels, so neighbouring tiles
+            # overlap by a pixel at most instead of leaving seams.
+            size = (max(int(math.ceil(width * zoom)), 1), max(int(math.ceil(height * zoom)), 1))
+            surface = pygame.transform.scale(surface, size).convert()
+            self.surfaces[key] = surface
+            self.cached_pixels += size[0] * size[1]
+            while self.cached_pixels > self.cache_pixels and len(self.surfaces) > 1:
+                _, evicted = self.surfaces.popitem(last=False)
+                self.cached_pixels -= evicted.get_width() * evicted.get_height()
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+    def begin_frame(self):
+        self.screen.fill(self.background_color)
+        camera, tile_size = self.camera, self.map.tile_size
+        left, top, right, bottom = camera.visible()
+        for row in range(max(int(top // tile_size), 0), min(int(bottom // tile_size) + 1, self.map.rows)):
+            for col in range(max(int(left // tile_size), 0), min(int(right // tile_size) + 1, self.map.cols)):
+                x, y = camera.to_screen(col * tile_size, row * tile_size)
+                self.screen.blit(self._tile_surface(row, col, camera.zoom), (math.floor(x), math.floor(y)))
+
+    def draw_path(self, points, color, width):
+        # A polyline in map pixels, such as a flown path.
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) > 1:
+            x, y = self.camera.to_screen(points[:, 0], points[:, 1])
+            pygame.draw.lines(self.screen, color, False, np.stack([x, y], axis=1).tolist(), width)
+
+    def end_frame(self):
+        pygame.display.flip()
+
+
+class ProfileOverlay:
+    # A box listing a profiling.Profiler's stages with their mean and 95th
+    # percentile milliseconds over its window, the frame rate and the ticks
+    # per second. The text is re-rendered only every refresh_frames frames,
+    # so the overlay costs one blit on the other frames and the numbers stay
+    # readable. A negative x in `position` counts from the right edge.
+
+    def __init__(self, profiler, font, position, refresh_frames=15, color=BLACK, background=WHITE):
+        self.profiler = profiler
+        self.font = font
+        self.position = position
+        self.refresh_frames = refresh_frames
+        self.color = color
+        self.background_color = background
+        self.visible = True
+        self.surface = None
+        self.rendered_at = None
+
+    def toggle(self):
+        self.visible = not self.visible
+
+    def _render(self):
+        fps, ticks_per_sec = self.profiler.rates()
+        lines = [f"{fps:5.1f} fps  {ticks_per_sec:6.1f} ticks/s"]
+        lines += [f"{name:<10} {stats['mean_ms']:6.2f} {stats['p95_ms']:6.2f} ms"
+                  for name, stats in self.profiler.summary().items()]
+        rendered = [self.font.render(line, True, self.color) for line in lines]
+        width = max(line.get_width() for line in rendered) + 8
+        height = sum(line.get_height() for line in rendered) + 8
+        surface = pygame.Surface((width, height))
+        surface.fill(self.background_color)
+        y = 4
+        for line in rendered:
+            surface.blit(line, (4, y))
+            y += line.get_height()
+        return surface
+
+    def draw(self, screen):
+        # Returns the screen area drawn, or None when hidden or disabled.
+        if not self.visible or not self.profiler.enabled:
+            return None
+        frames = self.profiler.frames
+        if self.surface is None or frames - self.rendered_at >= self.refresh_frames:
+            self.surface = self._render()
+            self.rendered_at = frames
+        x, y = self.position
+        if x < 0:
+            x += screen.get_width() - self.surface.get_width()
+        return screen.blit(self.surface, (x, y))
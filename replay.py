@@ -0,0 +1,212 @@
+import argparse
+import bisect
+import json
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+import kinematics
+import path_buffer
+import simulation
+
+FORMAT_VERSION = 1
+KEYFRAME_INTERVAL = simulation.TICK_RATE  # one keyframe per simulated second
+DEFAULT_DIR = 'recordings'
+
+# Class attributes that tune a Drone; recorded so that a flight recorded
+# with a front-end's Drone subclass replays with the same numbers.
+DRONE_PARAMETERS = ('radius_px', 'pixel_to_cm', 'max_battery', 'battery_drain_per_tick', 'cruise_speed_mps',
+                    'return_speed_mps', 'return_battery_margin', 'return_reserve_ticks', 'return_mode',
+                    'swept_collision', 'max_path_points') + kinematics.LIMITS
+# Parameters recordings made before they existed were flown with.
+LEGACY_PARAMETERS = {'swept_collision': False, 'return_reserve_ticks': None, 'max_path_points': None}
+# Instance attributes that, with the flown path, make up a drone's state.
+DRONE_STATE = ('x', 'y', 'vx', 'vy', 'yaw', 'pitch', 'roll', 'current_index', 'battery', 'crashed', 'returning',
+               'target_vx', 'target_vy', 'target_yaw', 'flown_px')
+
+
+def default_path(seed, directory=None):
+    directory = directory or os.environ.get('DRONE_RECORD_DIR', DEFAULT_DIR)
+    return os.path.join(directory, time.strftime('flight-%Y%m%d-%H%M%S') + f'-{seed}.npz')
+
+
+def snapshot(drone, tick, state):
+    keyframe = {name: getattr(drone, name) for name in DRONE_STATE}
+    keyframe['waypoints'] = [list(waypoint) for waypoint in drone.waypoints]
+    keyframe['path_points'] = drone.path.appended
+    keyframe['tick'] = tick
+    keyframe['state'] = state
+    return keyframe
+
+
+def restore(drone, keyframe, path):
+    # `path` is the full flown path of the recording; a keyframe only keeps
+    # how much of it had been flown at the time. The drone's bounded path is
+    # rebuilt from it as it was then.
+    for name in DRONE_STATE:
+        # Recordings from before motion limits have no setpoints; their
+        # drones never needed them.
+        if name in keyframe:
+            setattr(drone, name, keyframe[name])
+    drone.waypoints = [tuple(waypoint) for waypoint in keyframe['waypoints']]
+    drone.path = path_buffer.PathBuffer.from_array(path[:keyframe['path_points']], max_points=drone.max_path_points)
+    # A retracing drone rebuilds its field from the restored path.
+    drone.retrace_field = None
+
+
+class FlightRecorder:
+    # Captures everything needed to re-run a flight: the map, the seed the
+    # drone was spawned with, its tuning and the command of every tick, plus
+    # a keyframe of the drone state every keyframe_interval ticks. The
+    # drone's own path is bounded, so the recorder keeps every point of it.
+
+    def __init__(self, map_id, seed, drone, dt=simulation.FIXED_DT, keyframe_interval=KEYFRAME_INTERVAL):
+        self.header = {
+            'version': FORMAT_VERSION,
+            'map': map_id,
+            'seed': seed,
+            'dt': dt,
+            'spawn': [drone.initial_x, drone.initial_y],
+            'drone': {name: getattr(drone, name) for name in DRONE_PARAMETERS},
+            'keyframe_interval': keyframe_interval,
+        }
+        self.commands = []
+        self.keyframes = [snapshot(drone, 0, simulation.FLYING)]
+        self.state = simulation.FLYING
+        self.drone = drone
+        self.path = path_buffer.PathBuffer.from_array(drone.path.array())
+
+    @property
+    def ticks(self):
+        return len(self.commands)
+
+    def record(self, command, state):
+        # Call once per tick, after simulation.step, with the command that was
+        # fed to it and the state it returned.
+        if command is None:
+            self.commands.append((0.0, 0.0, math.nan, 0.0))
+        else:
+            yaw = math.nan if command.yaw is None else command.yaw
+            self.commands.append((command.vx, command.vy, yaw, 1.0))
+        self.state = state
+        for x, y in self.drone.path.since(self.path.appended).tolist():
+            self.path.append(x, y)
+        if self.ticks % self.header['keyframe_interval'] == 0:
+            self.keyframes.append(snapshot(self.drone, self.ticks, state))
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        header = dict(self.header, ticks=self.ticks, keyframes=self.keyframes,
+                      final=snapshot(self.drone, self.ticks, self.state))
+        np.savez_compressed(path, header=np.array(json.dumps(header)),
+                            commands=np.array(self.commands, dtype=np.float64).reshape(-1, 4),
+                            path=self.path.array())
+        return path
+
+
+class Replay:
+    # Re-executes a recorded flight headlessly, as fast as the CPU allows.
+    # seek(tick) restores the nearest keyframe at or before the tick and
+    # simulates only the ticks after it, so seeking costs at most one
+    # keyframe interval of simulation wherever the tick lies.
+
+    def __init__(self, path, world=None):
+        with np.load(path) as data:
+            self.header = json.loads(str(data['header']))
+            self.commands = data['commands']
+            self.path = data['path']
+        if self.header['version'] != FORMAT_VERSION:
+            raise ValueError(f"unsupported recording format version {self.header['version']}")
+        self.world = world or simulation.World.from_id(self.header['map'])
+        self.dt = self.header['dt']
+        self.keyframes = self.header['keyframes']
+        self.keyframe_ticks = [keyframe['tick'] for keyframe in self.keyframes]
+        self.drone_class = type('RecordedDrone', (simulation.Drone,), dict(LEGACY_PARAMETERS, **self.header['drone']))
+
+        drone = self.world.spawn(self.drone_class, random.Random(self.header['seed']))
+        if [drone.initial_x, drone.initial_y] != self.header['spawn']:
+            raise ValueError("recording does not replay on this map: the seed spawns the drone elsewhere")
+        self.home_field = drone.home_field
+        self.drone = drone
+        self.tick = 0
+        self.state = simulation.FLYING
+
+    @property
+    def ticks(self):
+        return len(self.commands)
+
+    def command(self, tick):
+        vx, vy, yaw, present = self.commands[tick]
+        if not present:
+            return None
+        return simulation.Command(float(vx), float(vy), None if math.isnan(yaw) else float(yaw))
+
+    def seek(self, tick):
+        tick = min(max(tick, 0), self.ticks)
+        keyframe = self.keyframes[bisect.bisect_right(self.keyframe_ticks, tick) - 1]
+        # Simulating on from where the replay already is beats restoring
+        # unless the keyframe is closer.
+        if tick < self.tick or keyframe['tick'] > self.tick:
+            restore(self.drone, keyframe, self.path)
+            self.drone.home_field = self.home_field
+            self.tick, self.state = keyframe['tick'], keyframe['state']
+        while self.tick < tick:
+            self.step()
+        return self.drone
+
+    def step(self):
+        self.state = simulation.step(self.world, self.drone, self.command(self.tick), self.dt)
+        self.tick += 1
+        return self.state
+
+    def run(self):
+        return self.seek(self.ticks)
+
+    def verify(self):
+        # Replays the whole flight and reports every state variable that
+        # ended up differently from the recording.
+        self.run()
+        expected = self.header['final']
+        actual = snapshot(self.drone, self.tick, self.state)
+        return {name: (expected[name], actual[name]) for name in expected if expected[name] != actual[name]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded flight headlessly.")
+    parser.add_argument('recording')
+    parser.add_argument('--seek', type=int, default=None, help="stop at this tick instead of the end")
+    parser.add_argument('--verify', action='store_true', help="check the replay ends as the recording did")
+    args = parser.parse_args(argv)
+
+    replay = Replay(args.recording)
+    started = time.perf_counter()
+    if args.verify:
+        mismatches = replay.verify()
+    else:
+        replay.seek(replay.ticks if args.seek is None else args.seek)
+        mismatches = None
+    elapsed = time.perf_counter() - started
+    drone = replay.drone
+    report = {
+        'map': replay.header['map'],
+        'seed': replay.header['seed'],
+        'tick': replay.tick,
+        'state': replay.state,
+        'x': drone.x,
+        'y': drone.y,
+        'battery': drone.battery,
+        'speedup': replay.tick * replay.dt / elapsed if elapsed else None,
+    }
+    if mismatches is not None:
+        report['mismatches'] = mismatches
+    print(json.dumps(report))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
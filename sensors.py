@@ -0,0 +1,118 @@
+import math
+
+import numpy as np
+
+PIXEL_TO_CM = 2.5
+MAX_RANGE_CM = 300
+# Six beams around the drone, clockwise from its nose, in degrees off yaw.
+SENSOR_ANGLES_DEG = (0, 60, 120, 180, 240, 300)
+# Rays are sampled every half pixel, so a reading overshoots a wall by at
+# most that much.
+SAMPLE_SPACING_PX = 0.5
+MIN_CHUNK_SAMPLES = 16
+CHUNK_BUDGET = 4096
+SQRT2 = math.sqrt(2)
+
+
+class RangeSensors:
+    # Range finders cast against an occupancy grid. All beams of all drones
+    # are marched together in batched gathers, so reading one drone or a
+    # whole swarm is a handful of NumPy calls. Points off the map count as
+    # walls.
+    #
+    # Readings are in cm. noise_std_cm and noise_fraction add Gaussian noise
+    # with a fixed and a range-proportional standard deviation, and
+    # dropout is the chance that a beam returns no echo (max range).
+
+    def __init__(self, grid, clearance=None, pixel_to_cm=PIXEL_TO_CM, max_range_cm=MAX_RANGE_CM, angles=SENSOR_ANGLES_DEG,
+                 noise_std_cm=0.0, noise_fraction=0.0, dropout=0.0, rng=None):
+        self.grid = np.asarray(grid)
+        self.clearance = None if clearance is None else np.asarray(clearance)
+        self.pixel_to_cm = pixel_to_cm
+        self.max_range_cm = max_range_cm
+        self.max_range_px = max_range_cm / pixel_to_cm
+        self.angles = np.radians(np.asarray(angles, dtype=np.float64))
+        self.noise_std_cm = noise_std_cm
+        self.noise_fraction = noise_fraction
+        self.dropout = dropout
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def read(self, x, y, yaw):
+        # x, y in pixels and yaw in degrees, as scalars for one drone or
+        # arrays for many. Returns one reading per beam, with the beams on
+        # the last axis.
+        x, y, yaw = np.broadcast_arrays(*(np.asarray(value, dtype=np.float64) for value in (x, y, yaw)))
+        headings = np.radians(yaw)[..., None] + self.angles
+        origin_x = np.broadcast_to(x[..., None], headings.shape)
+        origin_y = np.broadcast_to(y[..., None], headings.shape)
+        # yaw 0 points up the screen (-y) and 90 to the right (+x).
+        start = self.free_radius(x, y)
+        distance = self.cast(origin_x.ravel(), origin_y.ravel(), np.sin(headings).ravel(), -np.cos(headings).ravel(),
+                             np.broadcast_to(start[..., None], headings.shape).ravel()) * self.pixel_to_cm
+        return self.add_noise(distance).reshape(headings.shape)
+
+    def free_radius(self, x, y):
+        # Distance around each point that is known to be free of walls, which
+        # every beam from it can skip without sampling.
+        if self.clearance is None:
+            return np.zeros(np.shape(x))
+        height, width = self.clearance.shape
+        col, row = np.floor(x).astype(np.int64), np.floor(y).astype(np.int64)
+        inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+        clearance = self.clearance[np.clip(row, 0, height - 1), np.clip(col, 0, width - 1)]
+        # Clearance is measured between pixel centres and a wall pixel reaches
+        # half a pixel towards the point, which can itself sit anywhere in its
+        # pixel. The map edge counts as a wall but is not in the clearance map.
+        edge = np.minimum(np.minimum(x, width - x), np.minimum(y, height - y))
+        return np.where(inside, np.maximum(np.minimum(clearance - SQRT2, edge), 0), 0)
+
+    def cast(self, x, y, dx, dy, start=None):
+        # Distance in pixels along each unit ray (dx, dy) from (x, y) to the
+        # first obstacle sample, or max_range_px when there is none in range.
+        # Sampling begins `start` pixels out along each ray.
+        grid = self.grid
+        height, width = grid.shape
+        x, y, dx, dy = (np.asarray(value, dtype=np.float64) for value in (x, y, dx, dy))
+        start = np.zeros(len(x)) if start is None else np.minimum(start, self.max_range_px)
+        distance = np.full(len(x), self.max_range_px)
+        span = self.max_range_px - start.min() if len(x) else 0
+        samples = np.arange(0, span + SAMPLE_SPACING_PX, SAMPLE_SPACING_PX)
+        # Sample all rays a chunk at a time and keep marching only the ones
+        # that are still clear. A few drones get all of their samples in one
+        # chunk, a swarm gets small chunks so walls close by end it early.
+        chunk = max(MIN_CHUNK_SAMPLES, CHUNK_BUDGET // max(len(x), 1))
+        pending = np.arange(len(x))
+        for begin in range(0, len(samples), chunk):
+            # Each chunk repeats the last sample of the one before, so the
+            # step between them is checked too.
+            first = max(begin - 1, 0)
+            t = np.minimum(start[pending, None] + samples[first:begin + chunk], self.max_range_px)
+            col = np.floor(x[pending, None] + dx[pending, None] * t).astype(np.int64)
+            row = np.floor(y[pending, None] + dy[pending, None] * t).astype(np.int64)
+            inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+            col, row = np.clip(col, 0, width - 1), np.clip(row, 0, height - 1)
+            blocked = ~inside | grid[row, col]
+            # A step into a diagonal neighbour passes through the corner
+            # between two other pixels; a wall drawn one pixel thick along
+            # a diagonal would let the ray slip through there, so treat
+            # either of them as an echo.
+            diagonal = (col[:, 1:] != col[:, :-1]) & (row[:, 1:] != row[:, :-1])
+            corner = grid[row[:, :-1], col[:, 1:]] | grid[row[:, 1:], col[:, :-1]]
+            blocked[:, 1:] |= diagonal & corner
+            blocked, t = blocked[:, begin - first:], t[:, begin - first:]
+
+            hit = blocked.any(axis=1)
+            distance[pending[hit]] = t[hit, blocked[hit].argmax(axis=1)]
+            # Rays that ran out of range are done too.
+            pending = pending[~hit & (t[:, -1] < self.max_range_px)]
+            if not len(pending):
+                break
+        return distance
+
+    def add_noise(self, distance):
+        if self.noise_std_cm or self.noise_fraction:
+            sigma = self.noise_std_cm + self.noise_fraction * distance
+            distance = distance + self.rng.normal(0.0, 1.0, distance.shape) * sigma
+        if self.dropout:
+            distance = np.where(self.rng.random(distance.shape) < self.dropout, self.max_range_cm, distance)
+        return np.clip(distance, 0.0, self.max_range_cm)
@@ -0,0 +1,506 @@
+import argparse
+import json
+import math
+import random
+from collections import namedtuple
+
+import numpy as np
+
+import kinematics
+import occupancy
+import path_buffer
+import planner
+import sensors
+
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+PIXEL_TO_CM = 2.5
+DRONE_RADIUS_CM = 10
+DRONE_RADIUS_PX = int(DRONE_RADIUS_CM / PIXEL_TO_CM)
+SENSOR_UPDATE_RATE = 10  # 10Hz
+MAX_BATTERY_LIFE_SEC = 10
+MAX_SPEED_MPS = 10
+SPEED_FACTOR = 1.5
+INFO_DISPLAY_HEIGHT = 50
+
+# The original game advanced one tick per rendered frame at 60 FPS; the
+# per-tick constants below are expressed against that rate and scaled by dt.
+TICK_RATE = 60
+FIXED_DT = 1 / TICK_RATE
+SENSOR_PERIOD_TICKS = TICK_RATE // SENSOR_UPDATE_RATE
+MESSAGE_HOLD_TICKS = 2 * TICK_RATE  # how long a game shows a transition message
+
+FLYING = 'flying'
+RETURNING = 'returning'
+LANDED = 'landed'
+CRASHED = 'crashed'
+STRANDED = 'stranded'  # out of battery or no way back home
+HOLDING = 'holding'  # an Episode is showing a message instead of stepping
+
+# Map ids name either a map image path or a generated maze by its seed,
+# as 'maze:<seed>' for the backtracker or 'maze:<algorithm>:<seed>'. Ids
+# starting with TILES_PREFIX name a region of a tiled map (see tiles.py).
+MAZE_PREFIX = 'maze:'
+TILES_PREFIX = 'tiles:'
+
+Command = namedtuple('Command', ['vx', 'vy', 'yaw'])
+HOVER = Command(0, 0, None)
+
+
+class Drone:
+    radius_px = DRONE_RADIUS_PX
+    pixel_to_cm = PIXEL_TO_CM
+    max_battery = MAX_BATTERY_LIFE_SEC
+    battery_drain_per_tick = 1 / SENSOR_UPDATE_RATE
+    cruise_speed_mps = MAX_SPEED_MPS * SPEED_FACTOR
+    return_speed_mps = MAX_SPEED_MPS * SPEED_FACTOR
+    return_battery_margin = 0.25  # keep 25% more battery than the trip home needs
+    # How the drone flies home (see planner.PLAN_MODES): 'shortest' follows
+    # the home field over the whole map, 'retrace' keeps to the cells it has
+    # flown through and budgets its battery for the way it came.
+    return_mode = 'shortest'
+    # Ticks of drain kept on top of the margin: the check runs before the
+    # tick that drains, and the last stretch home is a whole tick however
+    # short it is. None keeps the unrounded estimate older recordings used.
+    return_reserve_ticks = 2
+    # Motion limits (see kinematics.LIMITS); unset, commands take effect at
+    # once. The flight home is exempt: the home field's route passes walls
+    # with no more than the drone's radius to spare, so it is only safe
+    # flown exactly, and the battery reserve is worked out for flying it at
+    # return_speed_mps. A limited drone therefore turns for home at once.
+    # The pygame games leave them unset too: they run on a compressed clock
+    # (the battery lasts 100 ticks), on which ACCELERATION_MPS2 and the
+    # attitude limits would leave the drone crawling.
+    max_acceleration_mps2 = None
+    max_pitch_deg = None
+    max_roll_deg = None
+    max_yaw_rate_dps = None
+    # Test the whole move of each tick for walls, not just where it ends, so
+    # that fast drones and large steps cannot pass through thin walls.
+    swept_collision = True
+    # Points of the flown path kept before its older parts are simplified
+    # (see path_buffer.PathBuffer); None keeps every point.
+    max_path_points = 1 << 16
+
+    def __init__(self, x, y):
+        self.initial_x = x
+        self.initial_y = y
+        self.home_field = None
+        self.sensors = None
+        self.reset()
+
+    def reset(self):
+        self.x = self.initial_x
+        self.y = self.initial_y
+        self.home = (self.x, self.y)
+        self.vx = 0
+        self.vy = 0
+        self.yaw = 0
+        self.pitch = 0
+        self.roll = 0
+        # The velocity and heading last commanded, which a drone with motion
+        # limits is still working towards.
+        self.target_vx = 0
+        self.target_vy = 0
+        self.target_yaw = None
+        self.current_index = 0
+        self.battery = self.max_battery
+        self.crashed = False
+        self.contact_normal = None
+        self.path = path_buffer.PathBuffer([(self.x, self.y)], max_points=self.max_path_points)
+        self.flown_px = 0.0
+        self.waypoints = []
+        self.returning = False
+        self.retrace_field = None
+
+    def battery_needed_to_return(self, dt=FIXED_DT):
+        # The trip home is rounded up to whole steps of dt, and the reserve
+        # is counted in those steps too.
+        if self.home_field is None:
+            return self.max_battery / 2
+        ticks = dt * TICK_RATE
+        # Flying back through the same cells is no longer than the way out.
+        distance = self.flown_px if self.return_mode == 'retrace' else self.home_field.distance(self.x, self.y)
+        steps = distance / (self.return_speed_mps / self.pixel_to_cm * ticks)
+        if math.isinf(steps) or self.return_reserve_ticks is None:
+            return steps * ticks * self.battery_drain_per_tick * (1 + self.return_battery_margin)
+        steps = math.ceil(steps * (1 + self.return_battery_margin)) + self.return_reserve_ticks
+        return steps * ticks * self.battery_drain_per_tick
+
+    def should_return_home(self, dt=FIXED_DT):
+        needed = self.battery_needed_to_return(dt)
+        if math.isinf(needed):
+            needed = self.max_battery / 2
+        return self.battery <= needed
+
+    def retrace(self, grid):
+        # Builds the field a retracing drone follows home: the home field
+        # over only the cells it has flown through. The path stops growing
+        # once the drone turns back, so the field does not change after.
+        # Where those cells do not lead home it falls back to the home field.
+        field = planner.HomeField(grid, self.home, self.radius_px, flown_path=self.path)
+        self.retrace_field = self.home_field if math.isinf(field.distance(self.x, self.y)) else field
+
+    def fly_home(self, speed, dt=FIXED_DT):
+        # Follows the home field one cell at a time, carrying whatever is
+        # left of this tick's step past a cell centre on to the next one.
+        # Returns True once the drone is back home and None when home
+        # cannot be reached.
+        field = self.retrace_field or self.home_field
+        ticks = dt * TICK_RATE
+        budget = speed / self.pixel_to_cm * ticks
+        x, y = self.x, self.y
+        while True:
+            if not self.waypoints:
+                waypoint = field.next_waypoint(x, y)
+                if waypoint is None:
+                    return None
+                self.waypoints.append(waypoint)
+            target_x, target_y = self.waypoints[0]
+            distance = math.hypot(target_x - x, target_y - y)
+            if distance > budget:
+                x += (target_x - x) / distance * budget
+                y += (target_y - y) / distance * budget
+                break
+            x, y = target_x, target_y
+            budget -= distance
+            if self.waypoints.pop(0) == self.home:
+                break
+
+        self.vx = (x - self.x) * self.pixel_to_cm / ticks
+        self.vy = (y - self.y) * self.pixel_to_cm / ticks
+        if self.vx or self.vy:
+            self.yaw = math.degrees(math.atan2(self.vx, -self.vy)) % 360
+        return (x, y) == self.home
+
+    def command(self, command):
+        self.target_vx, self.target_vy = command.vx, command.vy
+        if command.yaw is not None:
+            self.target_yaw = command.yaw
+        if not kinematics.is_limited(type(self)):
+            self.vx, self.vy = command.vx, command.vy
+            if command.yaw is not None:
+                self.yaw = command.yaw
+
+    def move(self, dt=FIXED_DT):
+        if not self.crashed:
+            ticks = dt * TICK_RATE
+            if self.returning or not kinematics.is_limited(type(self)):
+                self.x += self.vx / self.pixel_to_cm * ticks
+                self.y += self.vy / self.pixel_to_cm * ticks
+                self.pitch = self.roll = 0
+            else:
+                target_yaw = math.nan if self.target_yaw is None else self.target_yaw
+                state = kinematics.integrate(self.x, self.y, self.vx, self.vy, self.yaw, self.target_vx,
+                                             self.target_vy, target_yaw, dt, type(self), TICK_RATE / self.pixel_to_cm)
+                self.x, self.y, self.vx, self.vy, self.yaw, self.pitch, self.roll = (float(value) for value in state)
+            self.battery -= self.battery_drain_per_tick * ticks
+
+    def update_sensors(self, include_path=False):
+        if self.sensors is None:
+            distance = [100, 100, 100, 100, 100, 100]
+        else:
+            distance = [float(d) for d in self.sensors.read(self.x, self.y, self.yaw)]
+        readings = {
+            'distance': distance,
+            'yaw': self.yaw,
+            'Vx': self.vx,
+            'Vy': self.vy,
+            'Z': 0,
+            'baro': 1013.25,
+            'bat': self.battery,
+            'pitch': self.pitch,
+            'roll': self.roll,
+            'accX': 0,
+            'accY': 0,
+            'accZ': 0,
+        }
+        # The path grows for the whole flight, so it is only handed out when
+        # asked for.
+        if include_path:
+            readings['path'] = self.path
+        return readings
+
+    def check_collision(self, obstacles):
+        if occupancy.footprint_collides(obstacles, self.x, self.y, self.radius_px):
+            self.crash()
+            return True
+
+    def check_sweep(self, world, start_x, start_y):
+        # Swept counterpart of check_collision for the move from (start_x,
+        # start_y) to the current position: on a hit the drone is put back
+        # where it touched the wall.
+        hit, t, normal_x, normal_y = world.sweep(start_x, start_y, self.x, self.y, self.radius_px)
+        if hit:
+            self.x = start_x + float(t) * (self.x - start_x)
+            self.y = start_y + float(t) * (self.y - start_y)
+            self.crash((float(normal_x), float(normal_y)))
+            return True
+
+    def record_path(self, start_x, start_y):
+        # Adds the move from (start_x, start_y) to the flown path, once the
+        # collision test has put a crashed drone back where it touched.
+        if not self.returning:
+            self.flown_px += math.hypot(self.x - start_x, self.y - start_y)
+            self.path.append(self.x, self.y)
+
+    def crash(self, normal=None):
+        self.crashed = True
+        self.contact_normal = normal
+        self.vx = 0
+        self.vy = 0
+
+
+class World:
+    def __init__(self, grid, spawn_bounds=None, range_sensors=None, clearance=None):
+        self.grid = grid
+        self.clearance = occupancy.clearance_map(grid) if clearance is None else clearance
+        self.sensors = range_sensors or sensors.RangeSensors(grid, self.clearance, PIXEL_TO_CM)
+        height, width = grid.shape
+        self.spawn_bounds = spawn_bounds or (0, 0, width - 1, height - 1)
+        # Where the grid sits on the map it was cut from, for worlds over a
+        # region of a tiled map.
+        self.origin = (0, 0)
+        self._walls = None
+        self._free_masks = {}
+
+    def free_mask(self, radius):
+        # occupancy.collision_free_mask for a footprint radius, built once.
+        if radius not in self._free_masks:
+            self._free_masks[radius] = occupancy.collision_free_mask(self.grid, radius)
+        return self._free_masks[radius]
+
+    def sweep(self, x0, y0, x1, y1, radius):
+        return occupancy.sweep(self.free_mask(radius), x0, y0, x1, y1)
+
+    @property
+    def walls(self):
+        # The walls as merged rectangles (see walls.wall_rects), for painting
+        # the map. Collisions and sensors work on the grid, so this is built
+        # on first use.
+        if self._walls is None:
+            import walls
+
+            self._walls = walls.wall_rects(self.grid)
+        return self._walls
+
+    @classmethod
+    def from_image(cls, image_path, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, top_margin=INFO_DISPLAY_HEIGHT):
+        import map_cache
+
+        grid = map_cache.load_grid(image_path, width, height, top_margin=top_margin)
+        bounds = (DRONE_RADIUS_PX, top_margin + DRONE_RADIUS_PX, width - DRONE_RADIUS_PX, height - DRONE_RADIUS_PX)
+        return cls(grid, bounds)
+
+    @classmethod
+    def from_id(cls, map_id):
+        if map_id.startswith(MAZE_PREFIX):
+            import mazes
+
+            algorithm, _, seed = map_id[len(MAZE_PREFIX):].rpartition(':')
+            grid = mazes.maze_grid(int(seed), algorithm=algorithm or mazes.DEFAULT_ALGORITHM)
+            height, width = grid.shape
+            return cls(grid, (DRONE_RADIUS_PX, DRONE_RADIUS_PX, width - DRONE_RADIUS_PX, height - DRONE_RADIUS_PX))
+        if map_id.startswith(TILES_PREFIX):
+            import tiles
+
+            return tiles.world_from_id(map_id)
+        return cls.from_image(map_id)
+
+    def spawn_positions(self, count, radius=DRONE_RADIUS_PX, rng=random):
+        return occupancy.sample_free_positions(self.clearance, radius, count, self.spawn_bounds, rng)
+
+    def spawn(self, drone_class=Drone, rng=random):
+        (x, y), = self.spawn_positions(1, drone_class.radius_px, rng)
+        if drone_class.return_mode not in planner.PLAN_MODES:
+            raise ValueError(f"unknown return mode {drone_class.return_mode!r}, expected one of {planner.PLAN_MODES}")
+        drone = drone_class(x, y)
+        drone.home_field = planner.HomeField(self.grid, drone.home, drone.radius_px)
+        drone.sensors = self.sensors
+        return drone
+
+
+def step(world, drone, command=None, dt=FIXED_DT):
+    # Advances one drone by dt and returns its state afterwards. `command`
+    # is only used while the drone is flying; once the battery calls it back
+    # the drone follows its home field on its own.
+    if drone.crashed:
+        return CRASHED
+    if not drone.returning and drone.should_return_home(dt):
+        drone.returning = True
+
+    home_reached = False
+    if drone.returning:
+        if drone.return_mode == 'retrace' and drone.retrace_field is None:
+            drone.retrace(world.grid)
+        home_reached = drone.fly_home(drone.return_speed_mps, dt)
+        if home_reached is None:
+            return STRANDED
+    elif command is not None:
+        drone.command(command)
+
+    start_x, start_y = drone.x, drone.y
+    drone.move(dt)
+    if drone.swept_collision:
+        crashed = drone.check_sweep(world, start_x, start_y)
+    else:
+        crashed = drone.check_collision(world.grid)
+    drone.record_path(start_x, start_y)
+    if crashed:
+        return CRASHED
+    if home_reached:
+        return LANDED
+    if drone.battery < 0:
+        return STRANDED
+    return RETURNING if drone.returning else FLYING
+
+
+class Episode:
+    # The flight of an interactive game as a state machine its main loop
+    # advances once per frame: flying -> returning -> landed, crashed or
+    # stranded -> reset. No transition blocks the loop. A message holds the
+    # simulation for hold_ticks frames while the game keeps drawing and
+    # handling events, and a crash then respawns a new drone on the world
+    # already loaded, so restarts cost a spawn and never grow the stack.
+    #
+    # A crash on the way home ends the episode instead of restarting it
+    # unless restart_returning is set. `respawned` is true for the frame in
+    # which a new drone took over, for games that keep per-flight state.
+
+    def __init__(self, world, drone_class=Drone, rng=random, hold_ticks=MESSAGE_HOLD_TICKS,
+                 low_battery_message=None, crash_message=None, restart_returning=True):
+        self.world = world
+        self.drone_class = drone_class
+        self.rng = rng
+        self.hold_ticks = hold_ticks
+        self.low_battery_message = low_battery_message
+        self.crash_message = crash_message
+        self.restart_returning = restart_returning
+        self.restarts = 0
+        self.reset()
+
+    def reset(self):
+        self.seed = self.rng.randrange(2 ** 32)
+        self.drone = self.world.spawn(self.drone_class, random.Random(self.seed))
+        self.state = FLYING
+        self.message = None
+        self.hold = 0
+        self.finished = False
+        self.respawned = True
+
+    def advance(self, command=None, dt=FIXED_DT):
+        # Returns the drone's state after this frame's step, or HOLDING while
+        # a message is up.
+        self.respawned = False
+        if self.finished:
+            return self.state
+        if self.hold:
+            self.hold -= 1
+            if not self.hold:
+                self.message = None
+                if self.state == CRASHED:
+                    self._restart()
+            return HOLDING
+
+        previous = self.state
+        self.state = step(self.world, self.drone, command, dt)
+        if self.state == RETURNING and previous == FLYING:
+            self._show(self.low_battery_message)
+        elif self.state == CRASHED and (previous == FLYING or self.restart_returning):
+            self._show(self.crash_message)
+            if not self.hold:
+                self._restart()
+        elif self.state in (LANDED, CRASHED, STRANDED):
+            self.finished = True
+        return self.state
+
+    def _restart(self):
+        self.restarts += 1
+        self.reset()
+
+    def _show(self, message):
+        if message is not None and self.hold_ticks > 0:
+            self.message = message
+            self.hold = self.hold_ticks
+
+
+def random_walk(rng=random, turn_probability=0.05, lookahead_ticks=3, dt=FIXED_DT):
+    # A wall-shy baseline controller: keeps its heading and picks a new axis
+    # direction at random, or when the next few steps of dt would hit a
+    # wall.
+    headings = ((0, -1, 0), (1, 0, 90), (0, 1, 180), (-1, 0, 270))
+    current = [None]
+
+    def controller(world, drone):
+        # Swept, so that steps longer than the footprint skip no walls.
+        reach_px = drone.cruise_speed_mps / drone.pixel_to_cm * dt * TICK_RATE * lookahead_ticks
+
+        def clear(heading):
+            dx, dy, _ = heading
+            return not world.sweep(drone.x, drone.y, drone.x + dx * reach_px, drone.y + dy * reach_px,
+                                   drone.radius_px)[0]
+
+        if current[0] is None or not clear(current[0]) or rng.random() < turn_probability:
+            options = [heading for heading in headings if clear(heading)]
+            current[0] = rng.choice(options) if options else None
+        if current[0] is None:
+            return HOVER
+        dx, dy, yaw = current[0]
+        return Command(dx * drone.cruise_speed_mps, dy * drone.cruise_speed_mps, yaw)
+
+    return controller
+
+
+def run_episode(world, controller=None, seed=None, max_ticks=100000, dt=FIXED_DT, drone_class=Drone,
+                on_sensors=None, stop=None):
+    # Flies one drone until it lands, crashes or strands, or until stop()
+    # says the controller has nothing left to do.
+    rng = random.Random(seed)
+    controller = controller or random_walk(rng, dt=dt)
+    drone = world.spawn(drone_class, rng)
+
+    state = FLYING
+    tick = 0
+    while tick < max_ticks:
+        command = controller(world, drone) if not drone.returning else None
+        state = step(world, drone, command, dt)
+        tick += 1
+        if on_sensors is not None and tick % SENSOR_PERIOD_TICKS == 0:
+            on_sensors(tick * dt, drone.update_sensors())
+        if state in (LANDED, CRASHED, STRANDED) or (stop is not None and stop()):
+            break
+
+    return {
+        'seed': seed,
+        'state': state,
+        'crashed': state == CRASHED,
+        'returned_home': state == LANDED,
+        'battery': drone.battery,
+        'path_length_px': path_length(drone.path),
+        'ticks': tick,
+        'sim_time_sec': tick * dt,
+    }
+
+
+def path_length(path):
+    points = np.asarray(path, dtype=np.float64).reshape(-1, 2)
+    return float(np.hypot(*np.diff(points, axis=0).T).sum())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run headless drone episodes on a map image.")
+    parser.add_argument('image_path')
+    parser.add_argument('--episodes', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-ticks', type=int, default=100000)
+    parser.add_argument('--dt', type=float, default=FIXED_DT,
+                        help="simulated seconds per tick; larger steps fast-forward (default: 1/60)")
+    args = parser.parse_args(argv)
+
+    world = World.from_image(args.image_path)
+    for episode in range(args.episodes):
+        print(json.dumps(run_episode(world, seed=args.seed + episode, max_ticks=args.max_ticks, dt=args.dt)))
+
+
+if __name__ == '__main__':
+    main()
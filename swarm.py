@@ -0,0 +1,211 @@
+import argparse
+import json
+import random
+
+import numpy as np
+
+import kinematics
+import occupancy
+import simulation
+
+# State codes for Swarm.state, indexing simulation's state names.
+STATES = (simulation.FLYING, simulation.RETURNING, simulation.LANDED, simulation.CRASHED, simulation.STRANDED)
+FLYING, RETURNING, LANDED, CRASHED, STRANDED = range(len(STATES))
+
+AXIS_HEADINGS = np.array([(0, -1, 0), (1, 0, 90), (0, 1, 180), (-1, 0, 270)], dtype=np.float64)
+
+
+class Swarm:
+    # Struct-of-arrays state for many drones sharing one world: entry i of
+    # every array belongs to drone i. Per-drone tuning comes from the same
+    # class attributes as simulation.Drone, so a front-end's Drone subclass
+    # configures a swarm the same way it configures a single drone.
+
+    def __init__(self, world, count, drone_class=simulation.Drone, rng=random):
+        self.world = world
+        self.drone_class = drone_class
+        self.radius_px = drone_class.radius_px
+        self.pixel_to_cm = drone_class.pixel_to_cm
+        self.free = world.free_mask(self.radius_px)
+
+        positions = np.array(world.spawn_positions(count, self.radius_px, rng), dtype=np.float64).reshape(-1, 2)
+        self.home_x = positions[:, 0].copy()
+        self.home_y = positions[:, 1].copy()
+        self.x = positions[:, 0].copy()
+        self.y = positions[:, 1].copy()
+        self.vx = np.zeros(count)
+        self.vy = np.zeros(count)
+        self.yaw = np.zeros(count)
+        self.pitch = np.zeros(count)
+        self.roll = np.zeros(count)
+        # Setpoints for drone classes with motion limits; NaN keeps the yaw.
+        self.target_vx = np.zeros(count)
+        self.target_vy = np.zeros(count)
+        self.target_yaw = np.full(count, np.nan)
+        self.battery = np.full(count, float(drone_class.max_battery))
+        self.crashed = np.zeros(count, dtype=np.bool_)
+        self.state = np.full(count, FLYING, dtype=np.uint8)
+        self.path_length_px = np.zeros(count)
+        self.ticks = 0
+
+    def __len__(self):
+        return len(self.x)
+
+    @property
+    def active(self):
+        return self.state <= RETURNING
+
+    def step(self, vx=None, vy=None, yaw=None, dt=simulation.FIXED_DT):
+        # Batched counterpart of simulation.step for drones under command.
+        # vx, vy and yaw are arrays (or scalars) over all drones; a NaN yaw
+        # keeps the current heading, like a Command with yaw=None. Drones
+        # that are no longer active ignore their commands.
+        active = self.active
+        ticks = dt * simulation.TICK_RATE
+        if kinematics.is_limited(self.drone_class):
+            # Commands set where each drone is heading; kinematics.integrate
+            # gets it there within the drone class's limits.
+            if vx is not None:
+                self.target_vx = np.where(active, vx, 0.0)
+            if vy is not None:
+                self.target_vy = np.where(active, vy, 0.0)
+            if yaw is not None:
+                yaw = np.broadcast_to(np.asarray(yaw, dtype=np.float64), self.yaw.shape)
+                self.target_yaw = np.where(active & ~np.isnan(yaw), yaw, self.target_yaw)
+            x, y, vx, vy, yaw, pitch, roll = kinematics.integrate(
+                self.x, self.y, self.vx, self.vy, self.yaw, self.target_vx, self.target_vy, self.target_yaw,
+                dt, self.drone_class, simulation.TICK_RATE / self.pixel_to_cm)
+            self.vx, self.vy = np.where(active, vx, 0.0), np.where(active, vy, 0.0)
+            self.yaw = np.where(active, yaw, self.yaw)
+            self.pitch, self.roll = np.where(active, pitch, 0.0), np.where(active, roll, 0.0)
+            dx, dy = np.where(active, x - self.x, 0.0), np.where(active, y - self.y, 0.0)
+        else:
+            if vx is not None:
+                self.vx = np.where(active, vx, 0.0)
+            if vy is not None:
+                self.vy = np.where(active, vy, 0.0)
+            if yaw is not None:
+                yaw = np.broadcast_to(np.asarray(yaw, dtype=np.float64), self.yaw.shape)
+                self.yaw = np.where(active & ~np.isnan(yaw), yaw, self.yaw)
+            dx = np.where(active, self.vx / self.pixel_to_cm * ticks, 0.0)
+            dy = np.where(active, self.vy / self.pixel_to_cm * ticks, 0.0)
+        start_x, start_y = self.x.copy(), self.y.copy()
+        self.x += dx
+        self.y += dy
+        self.battery -= np.where(active, self.drone_class.battery_drain_per_tick * ticks, 0.0)
+        self.ticks += 1
+
+        if self.drone_class.swept_collision:
+            # Drones that moved are swept from where they started; a hit puts
+            # them back at the point of contact.
+            hit, t, _, _ = occupancy.sweep(self.free, start_x, start_y, self.x, self.y)
+            hit &= active
+            self.x = np.where(hit, start_x + t * dx, self.x)
+            self.y = np.where(hit, start_y + t * dy, self.y)
+        else:
+            hit = active & self.collides()
+        # Measured after the sweep, so a crash only counts the way to the wall.
+        self.path_length_px += np.hypot(self.x - start_x, self.y - start_y)
+        self.crashed |= hit
+        self.vx[hit] = 0
+        self.vy[hit] = 0
+        self.state[hit] = CRASHED
+        self.state[active & ~hit & (self.battery < 0)] = STRANDED
+        return self.state
+
+    def collides(self, x=None, y=None):
+        # Footprint test for every drone at once: one gather from the
+        # precomputed free mask instead of a box scan per drone.
+        x = self.x if x is None else x
+        y = self.y if y is None else y
+        return ~occupancy.lookup(self.free, x, y)
+
+    def sense(self):
+        # Batched update_sensors: one array per reading, row i for drone i.
+        count = len(self)
+        return {
+            'distance': self.world.sensors.read(self.x, self.y, self.yaw),
+            'yaw': self.yaw.copy(),
+            'Vx': self.vx.copy(),
+            'Vy': self.vy.copy(),
+            'Z': np.zeros(count),
+            'baro': np.full(count, 1013.25),
+            'bat': self.battery.copy(),
+            'pitch': self.pitch.copy(),
+            'roll': self.roll.copy(),
+            'accX': np.zeros(count),
+            'accY': np.zeros(count),
+            'accZ': np.zeros(count),
+        }
+
+    def states(self):
+        return [STATES[code] for code in self.state]
+
+
+def random_walk(swarm, rng=None, turn_probability=0.05, lookahead_ticks=3, dt=simulation.FIXED_DT):
+    # Batched version of simulation.random_walk: every drone keeps its axis
+    # heading and draws a new clear one at random, or when the next few
+    # steps of dt would hit a wall.
+    rng = rng if rng is not None else np.random.default_rng()
+    count = len(swarm)
+    current = np.full(count, -1, dtype=np.int64)
+    speed = swarm.drone_class.cruise_speed_mps
+    reach_px = speed / swarm.pixel_to_cm * dt * simulation.TICK_RATE * lookahead_ticks
+
+    def controller(swarm):
+        # Swept, so that steps longer than the footprint skip no walls.
+        x, y = swarm.x[:, None], swarm.y[:, None]
+        clear = ~occupancy.sweep(swarm.free, x, y, x + AXIS_HEADINGS[:, 0] * reach_px,
+                                 y + AXIS_HEADINGS[:, 1] * reach_px)[0]
+
+        keep = (current >= 0) & clear[np.arange(count), np.maximum(current, 0)]
+        keep &= rng.random(count) >= turn_probability
+        # Pick uniformly among the clear headings by giving each a random
+        # score and taking the best one.
+        scores = np.where(clear, rng.random(clear.shape), -1.0)
+        choice = np.where(clear.any(axis=1), scores.argmax(axis=1), -1)
+        current[:] = np.where(keep, current, choice)
+
+        moving = current >= 0
+        heading = AXIS_HEADINGS[np.maximum(current, 0)]
+        vx = np.where(moving, heading[:, 0] * speed, 0.0)
+        vy = np.where(moving, heading[:, 1] * speed, 0.0)
+        yaw = np.where(moving, heading[:, 2], np.nan)
+        return vx, vy, yaw
+
+    return controller
+
+
+def run_swarm(world, count, controller=None, seed=None, max_ticks=100000, dt=simulation.FIXED_DT,
+              drone_class=simulation.Drone):
+    swarm = Swarm(world, count, drone_class, random.Random(seed))
+    controller = controller or random_walk(swarm, np.random.default_rng(seed), dt=dt)
+    while swarm.ticks < max_ticks and swarm.active.any():
+        swarm.step(*controller(swarm), dt=dt)
+
+    counts = np.bincount(swarm.state, minlength=len(STATES))
+    return {
+        'seed': seed,
+        'drones': count,
+        'states': {name: int(n) for name, n in zip(STATES, counts)},
+        'crash_rate': float(swarm.crashed.mean()) if count else 0.0,
+        'mean_path_length_px': float(swarm.path_length_px.mean()) if count else 0.0,
+        'ticks': swarm.ticks,
+        'sim_time_sec': swarm.ticks * dt,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a headless swarm of drones on a map image.")
+    parser.add_argument('image_path')
+    parser.add_argument('--drones', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-ticks', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    world = simulation.World.from_image(args.image_path)
+    print(json.dumps(run_swarm(world, args.drones, seed=args.seed, max_ticks=args.max_ticks)))
+
+
+if __name__ == '__main__':
+    main()
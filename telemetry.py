@@ -0,0 +1,107 @@
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b'DRONETLM'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sHH')
+DEFAULT_DIR = 'telemetry'
+BLOCK_RECORDS = 1024
+
+# One fixed-size little-endian record per sensor update. RECORD and
+# RECORD_DTYPE describe the same layout, for packing and for reading back.
+RECORD = struct.Struct('<dI8f6f')
+RECORD_DTYPE = np.dtype([
+    ('t', '<f8'), ('tick', '<u4'),
+    ('x', '<f4'), ('y', '<f4'), ('yaw', '<f4'), ('vx', '<f4'), ('vy', '<f4'),
+    ('pitch', '<f4'), ('roll', '<f4'), ('battery', '<f4'),
+    ('distance', '<f4', (6,)),
+])
+
+
+def default_path(directory=None):
+    directory = directory or os.environ.get('DRONE_TELEMETRY_DIR', DEFAULT_DIR)
+    return os.path.join(directory, time.strftime('flight-%Y%m%d-%H%M%S.tlm'))
+
+
+class TelemetryWriter:
+    # Packs records into a preallocated block and hands full blocks to a
+    # background thread that writes them out, so logging a record costs one
+    # struct.pack_into on the caller's side and never waits on the disk.
+    # Path snapshots are written on request only, next to the stream.
+
+    def __init__(self, path, block_records=BLOCK_RECORDS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.size))
+        self.block_records = block_records
+        self.block = bytearray(RECORD.size * block_records)
+        self.count = 0
+        self.records = 0
+        self.blocks = queue.Queue()
+        self.thread = threading.Thread(target=self._write_blocks, name='telemetry-writer', daemon=True)
+        self.thread.start()
+
+    def _write_blocks(self):
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                break
+            self.file.write(block)
+        self.file.close()
+
+    def log(self, t, tick, drone, readings):
+        # `readings` is a Drone.update_sensors() dict; the pose comes from
+        # the drone itself.
+        RECORD.pack_into(self.block, self.count * RECORD.size, t, tick,
+                         drone.x, drone.y, readings['yaw'], readings['Vx'], readings['Vy'],
+                         readings['pitch'], readings['roll'], readings['bat'], *readings['distance'])
+        self.count += 1
+        self.records += 1
+        if self.count == self.block_records:
+            self.flush()
+
+    def flush(self):
+        if self.count:
+            self.blocks.put(bytes(self.block[:self.count * RECORD.size]))
+            self.count = 0
+
+    def snapshot_path(self, tick, path):
+        snapshot = f'{self.path}.path-{tick}.npy'
+        np.save(snapshot, np.asarray(path, dtype=np.int32).reshape(-1, 2))
+        return snapshot
+
+    def close(self):
+        if self.thread.is_alive():
+            self.flush()
+            self.blocks.put(None)
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_telemetry(path):
+    # The whole flight as a structured array, one row per record, mapped
+    # from the file rather than parsed.
+    with open(path, 'rb') as f:
+        magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a telemetry stream")
+    if version != FORMAT_VERSION or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"unsupported telemetry format version {version} with {record_size}-byte records")
+    # A stream cut short by a crash can end in a partial record; skip it.
+    count = (os.path.getsize(path) - HEADER.size) // record_size
+    if not count:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER.size, shape=(count,))
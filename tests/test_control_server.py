@@ -0,0 +1,69 @@
+import asyncio
+import json
+import socket
+
+import pytest
+
+import control_server
+
+
+async def raw_connection(server):
+    # A loopback session whose replies are read as JSON lines, so that
+    # replies without a ref are seen too.
+    server_socket, client_socket = socket.socketpair()
+    reader, writer = await asyncio.open_connection(sock=server_socket)
+    handler = asyncio.ensure_future(server.handle(reader, writer))
+    reader, writer = await asyncio.open_connection(sock=client_socket)
+
+    async def request(line):
+        writer.write(line.encode() + b'\n')
+        await writer.drain()
+        return json.loads(await asyncio.wait_for(reader.readline(), 30))
+
+    return request, writer, handler
+
+
+@pytest.mark.parametrize('line', ['[1, 2]', '5', '"spawn"', 'null', 'not json'])
+def test_malformed_requests_get_errors_and_keep_the_session(line):
+    async def scenario():
+        server = control_server.ControlServer(speed=0)
+        request, writer, handler = await raw_connection(server)
+        assert (await request(line))['op'] == 'error'
+        reply = await request(json.dumps({'op': 'spawn', 'ref': 1, 'map': 'maze:0', 'seed': 1}))
+        assert reply['op'] == 'spawned' and reply['ref'] == 1
+        writer.close()
+        await handler
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('request_', [
+    {'op': 'spawn', 'ref': 3, 'map': 5},
+    {'op': 'spawn', 'ref': 3, 'map': ['maze:0']},
+    {'op': 'spawn', 'ref': 3, 'map': 'maze:nope'},
+    {'op': 'command', 'ref': 3, 'commands': [5]},
+    {'op': 'command', 'ref': 3, 'commands': [{'drone': 99, 'vx': 1}]},
+    {'op': 'despawn', 'ref': 3, 'drone': [0]},
+    {'op': 'fly', 'ref': 3},
+])
+def test_bad_fields_get_errors_with_their_ref(request_):
+    async def scenario():
+        server = control_server.ControlServer(speed=0)
+        request, writer, handler = await raw_connection(server)
+        reply = await request(json.dumps(request_))
+        assert reply['op'] == 'error' and reply['ref'] == 3
+        assert not handler.done()
+        writer.close()
+        await handler
+    asyncio.run(scenario())
+
+
+def test_world_cache_is_bounded():
+    async def scenario():
+        server = control_server.ControlServer(speed=0, world_cache_size=2)
+        client = await server.loopback()
+        for seed in range(4):
+            await client.spawn(f'maze:{seed}')
+        assert list(server.worlds) == ['maze:2', 'maze:3']
+        assert len(server.handlers) == 1
+        await client.close()
+    asyncio.run(scenario())
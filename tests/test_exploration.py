@@ -0,0 +1,27 @@
+import pytest
+
+import exploration
+import simulation
+
+LONG_BATTERY = type('Drone', (simulation.Drone,), {'max_battery': 1000})
+
+
+@pytest.mark.parametrize('seed', [0, 19, 26, 28])
+def test_explorer_without_oracle_does_not_crash(seed):
+    # Seeds that used to fly into walls hidden between the beams.
+    world = simulation.World.from_id('Maps/p11.png')
+    result = exploration.explore_episode(world, seed, max_ticks=1000, drone_class=LONG_BATTERY)
+    assert not result['crashed']
+    assert result['coverage'] > 0.1
+
+
+def test_passable_cells_have_no_unseen_neighbours():
+    world = simulation.World.from_id('maze:0')
+    explorer = exploration.Explorer(world.grid.shape)
+    simulation.run_episode(world, explorer, seed=0, max_ticks=300, drone_class=LONG_BATTERY)
+    grid = explorer.map
+    unknown = grid.cells == exploration.UNKNOWN
+    rows, cols = grid.passable.nonzero()
+    for row, col in zip(rows, cols):
+        assert not unknown[row - 1:row + 2, col - 1:col + 2].any()
+    assert len(rows)
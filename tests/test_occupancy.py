@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import mazes
+import occupancy
+
+
+@pytest.mark.parametrize('radius', [3, 10])
+def test_lookup_agrees_with_footprint_collides(radius):
+    grid = mazes.maze_grid(2, cell_size=20, width=200, height=160)
+    free = occupancy.collision_free_mask(grid, radius)
+    # Points on and off the map, at fractional positions too.
+    points = np.random.default_rng(0).uniform((-30, -30), (230, 190), (2000, 2))
+    expected = [occupancy.footprint_collides(grid, x, y, radius) for x, y in points.tolist()]
+    assert (~occupancy.lookup(free, points[:, 0], points[:, 1]) == expected).all()
+
+
+def test_batched_sweep_matches_single_segments():
+    grid = mazes.maze_grid(2, cell_size=20, width=200, height=160)
+    free = occupancy.collision_free_mask(grid, 3)
+    rng = np.random.default_rng(1)
+    starts = rng.uniform((-10, -10), (210, 170), (500, 2))
+    # Long and short moves, and axis-aligned and zero ones, which have
+    # boundaries on one axis only.
+    moves = rng.normal(0, 15, (500, 2)) * rng.choice([0.1, 1, 4], (500, 1))
+    moves[:50, 0] = 0
+    moves[50:100, 1] = 0
+    moves[100:110] = 0
+    ends = starts + moves
+    batched = occupancy.sweep(free, starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1])
+    for i, (x0, y0, x1, y1) in enumerate(np.hstack([starts, ends]).tolist()):
+        single = occupancy.sweep(free, x0, y0, x1, y1)
+        assert tuple(value[i] for value in batched) == pytest.approx(single)
+        hit, t, _, _ = single
+        # A move that hits stops in the last free pixel; one that does not
+        # ends in a free pixel.
+        if not hit:
+            assert occupancy.lookup(free, x1, y1)
+        elif t > 0:
+            back = max(t - 1e-6, 0)
+            assert occupancy.lookup(free, x0 + back * (x1 - x0), y0 + back * (y1 - y0))
+
+
+def test_sweep_does_not_pass_through_thin_walls():
+    grid = np.zeros((50, 100), dtype=np.bool_)
+    grid[:, 50] = True
+    free = occupancy.collision_free_mask(grid, 2)
+    assert occupancy.lookup(free, 40, 25)
+    assert occupancy.lookup(free, 60, 25)
+    hit, t, nx, ny = occupancy.sweep(free, 40.5, 25.5, 60.5, 25.5)
+    assert hit and 0 < t < 1 and (nx, ny) == (-1, 0)
+    hit = occupancy.sweep(free, np.array([40.5, 60.5]), 25.5, np.array([60.5, 40.5]), 25.5)[0]
+    assert hit.tolist() == [True, True]
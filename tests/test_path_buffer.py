@@ -0,0 +1,53 @@
+import numpy as np
+
+import path_buffer
+
+
+def wiggle(count, seed=0):
+    # A random walk of distinct pixels, like a flown path.
+    rng = np.random.default_rng(seed)
+    steps = rng.integers(-2, 3, (count, 2))
+    steps[(steps == 0).all(axis=1)] = (1, 0)
+    return np.cumsum(steps, axis=0).astype(np.int32)
+
+
+def test_bounded_buffer_stays_near_max_points():
+    buffer = path_buffer.PathBuffer(chunk_points=64, max_points=256)
+    points = wiggle(5000)
+    for x, y in points.tolist():
+        buffer.append(x, y)
+    assert buffer.appended == len(points)
+    assert len(buffer) < 256 + 64
+    assert len(buffer.array()) == len(buffer)
+    assert tuple(buffer.array()[-1]) == tuple(points[-1])
+
+
+def test_straight_runs_are_simplified_instead_of_dropped():
+    buffer = path_buffer.PathBuffer(chunk_points=64, max_points=256)
+    for x in range(10000):
+        buffer.append(x, 5)
+    retained = buffer.array()
+    assert len(retained) < 256
+    # The start of the flight is still there.
+    assert tuple(retained[0]) == (0, 5)
+
+
+def test_from_array_builds_the_same_buffer():
+    points = wiggle(3000, seed=1)
+    appended = path_buffer.PathBuffer(chunk_points=64, max_points=256)
+    for x, y in points.tolist():
+        appended.append(x, y)
+    loaded = path_buffer.PathBuffer.from_array(points, chunk_points=64, max_points=256)
+    assert (loaded.array() == appended.array()).all()
+    assert (loaded.dropped, loaded.appended, loaded.last) == (appended.dropped, appended.appended, appended.last)
+
+
+def test_since_gives_a_reader_that_keeps_up_every_point():
+    buffer = path_buffer.PathBuffer(chunk_points=16, max_points=64)
+    seen = []
+    read = 0
+    for x, y in wiggle(1000, seed=2).tolist():
+        buffer.append(x, y)
+        seen.extend(buffer.since(read).tolist())
+        read = buffer.appended
+    assert seen == wiggle(1000, seed=2).tolist()
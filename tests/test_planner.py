@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import planner
+import simulation
+
+
+def test_retrace_field_keeps_to_the_flown_corridor():
+    # An open room: the shortest way home is straight, the retraced one
+    # goes back round the detour the drone flew.
+    grid = np.zeros((200, 200), dtype=np.bool_)
+    home, there = (20, 100), (180, 100)
+    flown = [home, (20, 20), (180, 20), there]
+    shortest = planner.HomeField(grid, home, 4)
+    retrace = planner.HomeField(grid, home, 4, flown_path=flown)
+    assert shortest.distance(*there) == pytest.approx(160, abs=8)
+    # Round the corners of the detour, a cell either side of it.
+    assert 280 < retrace.distance(*there) <= 320
+    path = planner.plan_path(grid, there, home, 4, mode='retrace', flown_path=flown)
+    assert min(y for _, y in path) < 40
+
+
+@pytest.mark.parametrize('map_id', ['Maps/p12.png', 'maze:0'])
+def test_retracing_drones_land(map_id):
+    world = simulation.World.from_id(map_id)
+    drone_class = type('Drone', (simulation.Drone,), {'return_mode': 'retrace', 'max_battery': 30})
+    for seed in range(4):
+        result = simulation.run_episode(world, seed=seed, drone_class=drone_class)
+        assert result['state'] == simulation.LANDED, (seed, result)
+
+
+def test_unknown_return_mode_is_refused():
+    world = simulation.World.from_id('maze:0')
+    with pytest.raises(ValueError):
+        world.spawn(type('Drone', (simulation.Drone,), {'return_mode': 'teleport'}))
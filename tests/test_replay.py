@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+import replay
+import simulation
+
+
+def record(tmp_path, drone_class=simulation.Drone, map_id='maze:0', seed=3, max_ticks=None):
+    world = simulation.World.from_id(map_id)
+    drone = world.spawn(drone_class, random.Random(seed))
+    recorder = replay.FlightRecorder(map_id, seed, drone)
+    controller = simulation.random_walk(random.Random(seed))
+    state = simulation.FLYING
+    while state in (simulation.FLYING, simulation.RETURNING) and recorder.ticks != max_ticks:
+        command = controller(world, drone)
+        state = simulation.step(world, drone, command)
+        recorder.record(command, state)
+    return recorder, recorder.save(str(tmp_path / 'flight.npz'))
+
+
+def test_replay_verifies(tmp_path):
+    recorder, path = record(tmp_path)
+    assert recorder.ticks > replay.KEYFRAME_INTERVAL
+    assert replay.Replay(path).verify() == {}
+
+
+def test_seek_matches_a_straight_run(tmp_path):
+    recorder, path = record(tmp_path)
+    seeking = replay.Replay(path)
+    for tick in (recorder.ticks - 5, 7, replay.KEYFRAME_INTERVAL + 1, 0, recorder.ticks):
+        straight = replay.Replay(path)
+        while straight.tick < tick:
+            straight.step()
+        seeking.seek(tick)
+        assert replay.snapshot(seeking.drone, seeking.tick, seeking.state) == \
+            replay.snapshot(straight.drone, straight.tick, straight.state)
+
+
+def test_replay_rebuilds_a_compacted_path(tmp_path):
+    # A flight long enough for the drone's path to be simplified: the
+    # recording keeps every point and a seek rebuilds the bounded path.
+    drone_class = type('Drone', (simulation.Drone,), {'max_battery': 1000, 'max_path_points': 128})
+    ticks = simulation.path_buffer.CHUNK_POINTS + 500
+    recorder, path = record(tmp_path, drone_class, max_ticks=ticks)
+    assert recorder.drone.path.dropped
+    assert len(recorder.path) == recorder.drone.path.appended
+    flight = replay.Replay(path)
+    assert flight.verify() == {}
+    assert (flight.drone.path.array() == recorder.drone.path.array()).all()
+
+
+@pytest.mark.parametrize('seek', [-5, 10 ** 9])
+def test_seek_clamps_to_the_recording(tmp_path, seek):
+    recorder, path = record(tmp_path)
+    flight = replay.Replay(path)
+    flight.seek(seek)
+    assert flight.tick == min(max(seek, 0), recorder.ticks)
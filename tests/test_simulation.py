@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import planner
+import simulation
+import swarm
+
+
+@pytest.mark.parametrize('map_id', ['Maps/p12.png', 'maze:0'])
+@pytest.mark.parametrize('dt', [0.05, 0.1])
+def test_run_episode_fast_forward_does_not_crash(map_id, dt):
+    # Larger steps move further per step; the random walk's lookahead and
+    # the battery reserve have to count in those steps.
+    world = simulation.World.from_id(map_id)
+    for seed in range(6):
+        result = simulation.run_episode(world, seed=seed, dt=dt)
+        assert not result['crashed'], (seed, result)
+        assert result['state'] == simulation.LANDED, (seed, result)
+
+
+def wall_world():
+    # A room with a wall at x >= 100.
+    grid = np.zeros((60, 200), dtype=np.bool_)
+    grid[:, 100:] = True
+    return simulation.World(grid)
+
+
+def test_crash_records_the_point_of_contact():
+    world = wall_world()
+    drone = simulation.Drone(80.5, 30.5)
+    drone.home_field = planner.HomeField(world.grid, drone.home, drone.radius_px)
+    # 60 px in one step, well past the wall.
+    state = simulation.step(world, drone, simulation.Command(60 * drone.pixel_to_cm / 0.5, 0, None), dt=0.5)
+    assert state == simulation.CRASHED
+    assert drone.x < 100
+    assert drone.path[-1] == (int(drone.x), int(drone.y))
+    assert drone.flown_px == pytest.approx(drone.x - 80.5)
+
+
+def test_swarm_path_length_stops_at_the_wall():
+    world = wall_world()
+    group = swarm.Swarm(world, 2)
+    group.x[:], group.y[:] = [80.5, 20.5], [30.5, 30.5]
+    group.step(vx=np.array([60 * group.pixel_to_cm / 0.5, 0.0]), vy=np.zeros(2), dt=0.5)
+    assert group.crashed.tolist() == [True, False]
+    assert group.path_length_px[0] == pytest.approx(group.x[0] - 80.5)
+    assert group.path_length_px[1] == 0
@@ -0,0 +1,14 @@
+import numpy as np
+
+import mazes
+import walls
+
+
+def test_wall_rects_cover_the_grid_exactly():
+    grid = mazes.maze_grid(3)
+    rects = walls.wall_rects(grid)
+    painted = np.zeros(grid.shape, dtype=np.int32)
+    for left, top, width, height in rects.tolist():
+        painted[top:top + height, left:left + width] += 1
+    assert (painted == grid).all()
+    assert len(rects) < grid.sum() // 100
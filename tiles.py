@@ -0,0 +1,173 @@
+import argparse
+import json
+import math
+import os
+import random
+from collections import OrderedDict
+
+import numpy as np
+
+import occupancy
+import simulation
+
+FORMAT_VERSION = 1
+TILE_SIZE = 1024
+CACHE_TILES = 64
+META_FILE = 'map.json'
+TILES_FILE = 'tiles.npy'
+SPAWN_SLACK_PX = 64
+# Map ids of the region around a point of a tiled map that a drone can
+# reach: 'tiles:<map directory>:<x>,<y>,<reach>'.
+TILES_PREFIX = simulation.TILES_PREFIX
+
+
+def build(image_path, directory, tile_size=TILE_SIZE, threshold=occupancy.OBSTACLE_COLOR_THRESHOLD, mode='tuple'):
+    # Converts a map image at its native resolution into a tiled map: every
+    # tile_size x tile_size tile is stored contiguously in one .npy file, so
+    # a tile is one sequential read. The image is thresholded one band of
+    # tiles at a time, which keeps the RGB copy to a single band.
+    from PIL import Image
+
+    os.makedirs(directory, exist_ok=True)
+    # Floor plans are far beyond PIL's decompression-bomb limit.
+    limit, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+    try:
+        image = Image.open(image_path)
+        width, height = image.size
+        rows, cols = -(-height // tile_size), -(-width // tile_size)
+        tiles = np.lib.format.open_memmap(os.path.join(directory, TILES_FILE), mode='w+', dtype=np.bool_,
+                                          shape=(rows, cols, tile_size, tile_size))
+        # The padding of the last row and column of tiles lies outside the
+        # map and counts as wall.
+        band = np.ones((tile_size, cols * tile_size), dtype=np.bool_)
+        for row in range(rows):
+            top = row * tile_size
+            bottom = min(top + tile_size, height)
+            rgb = np.asarray(image.crop((0, top, width, bottom)).convert('RGB'))
+            band[:] = True
+            band[:bottom - top, :width] = occupancy.obstacle_mask(rgb, threshold, mode)
+            tiles[row] = band.reshape(tile_size, cols, tile_size).swapaxes(0, 1)
+        tiles.flush()
+        del tiles
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+    with open(os.path.join(directory, META_FILE), 'w') as f:
+        json.dump({'version': FORMAT_VERSION, 'width': width, 'height': height, 'tile_size': tile_size,
+                   'source': os.path.basename(image_path)}, f)
+    return TiledMap(directory)
+
+
+class TiledMap:
+    # A map of any size, memory-mapped from a tiled map directory. Nothing
+    # is read until a tile is asked for; tiles in use are copied out of the
+    # mapping into a small LRU cache, so memory depends on the area being
+    # looked at and not on the size of the map. Outside the map is wall.
+
+    def __init__(self, directory, cache_tiles=CACHE_TILES):
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        if meta['version'] != FORMAT_VERSION:
+            raise ValueError(f"unsupported tiled map format version {meta['version']}")
+        self.directory = directory
+        self.width = meta['width']
+        self.height = meta['height']
+        self.tile_size = meta['tile_size']
+        self.tiles = np.load(os.path.join(directory, TILES_FILE), mmap_mode='r')
+        self.rows, self.cols = self.tiles.shape[:2]
+        self.cache_tiles = cache_tiles
+        self.cache = OrderedDict()
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    def tile(self, row, col):
+        key = (row, col)
+        tile = self.cache.get(key)
+        if tile is None:
+            tile = np.array(self.tiles[row, col])
+            self.cache[key] = tile
+            if len(self.cache) > self.cache_tiles:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        return tile
+
+    def region(self, left, top, width, height):
+        # The occupancy grid of a rectangle of the map, as a fresh array.
+        size = self.tile_size
+        grid = np.ones((height, width), dtype=np.bool_)
+        for row in range(max(top // size, 0), min(-(-(top + height) // size), self.rows)):
+            for col in range(max(left // size, 0), min(-(-(left + width) // size), self.cols)):
+                x0, y0 = max(left, col * size), max(top, row * size)
+                x1, y1 = min(left + width, (col + 1) * size), min(top + height, (row + 1) * size)
+                grid[y0 - top:y1 - top, x0 - left:x1 - left] = \
+                    self.tile(row, col)[y0 - row * size:y1 - row * size, x0 - col * size:x1 - col * size]
+        return grid
+
+    def random_free_point(self, rng=random, attempts=1000):
+        # A free pixel anywhere on the map, found by sampling tiles so that
+        # only the sampled tiles are read.
+        for _ in range(attempts):
+            row, col = rng.randrange(self.rows), rng.randrange(self.cols)
+            free = np.flatnonzero(~self.tile(row, col))
+            if len(free):
+                y, x = divmod(int(free[rng.randrange(len(free))]), self.tile_size)
+                return col * self.tile_size + x, row * self.tile_size + y
+        raise ValueError(f"no free space found in {attempts} tiles of {self.directory}")
+
+    def world(self, left, top, width, height):
+        # A simulation.World over a region of the map. Positions in the world
+        # are relative to the region; world.origin is where it sits on the map.
+        left, top = max(int(left), 0), max(int(top), 0)
+        width, height = min(int(width), self.width - left), min(int(height), self.height - top)
+        radius = simulation.DRONE_RADIUS_PX
+        world = simulation.World(self.region(left, top, width, height),
+                                 (radius, radius, width - radius, height - radius))
+        world.origin = (left, top)
+        return world
+
+    def world_around(self, x, y, reach):
+        # The region a drone spawned within SPAWN_SLACK_PX of (x, y) can
+        # reach when it flies at most `reach` pixels, so that the edges of
+        # the region are never closer than the map's own walls would be.
+        # Spawns are restricted to that square around (x, y).
+        radius = simulation.DRONE_RADIUS_PX
+        x, y, margin = int(x), int(y), int(math.ceil(reach)) + SPAWN_SLACK_PX + radius
+        world = self.world(x - margin, y - margin, 2 * margin + 1, 2 * margin + 1)
+        left, top = world.origin
+        height, width = world.grid.shape
+        world.spawn_bounds = (max(x - left - SPAWN_SLACK_PX, radius), max(y - top - SPAWN_SLACK_PX, radius),
+                              min(x - left + SPAWN_SLACK_PX, width - radius),
+                              min(y - top + SPAWN_SLACK_PX, height - radius))
+        world.map_id = f'{TILES_PREFIX}{self.directory}:{x},{y},{int(math.ceil(reach))}'
+        return world
+
+
+def reach_px(drone_class=simulation.Drone):
+    # How far a drone can get from home on a full battery.
+    ticks = drone_class.max_battery / drone_class.battery_drain_per_tick
+    return ticks * max(drone_class.cruise_speed_mps, drone_class.return_speed_mps) / drone_class.pixel_to_cm
+
+
+def world_from_id(map_id):
+    directory, _, around = map_id[len(TILES_PREFIX):].rpartition(':')
+    x, y, reach = (int(value) for value in around.split(','))
+    return TiledMap(directory).world_around(x, y, reach)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a map image at full resolution into a tiled map.")
+    parser.add_argument('image')
+    parser.add_argument('directory')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE)
+    parser.add_argument('--threshold-mode', choices=occupancy.THRESHOLD_MODES, default='tuple')
+    args = parser.parse_args(argv)
+
+    tiled = build(args.image, args.directory, args.tile_size, mode=args.threshold_mode)
+    print(json.dumps({'directory': tiled.directory, 'width': tiled.width, 'height': tiled.height,
+                      'tiles': [tiled.rows, tiled.cols]}))
+
+
+if __name__ == '__main__':
+    main()
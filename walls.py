@@ -0,0 +1,29 @@
+import numpy as np
+
+
+def wall_rects(grid):
+    # Merges the blocked pixels of an occupancy grid into rectangles, as an
+    # (N, 4) int32 array of left, top, width, height. Every row is cut into
+    # runs of blocked pixels and runs with the same extent in consecutive
+    # rows are stacked into one rectangle, so a maze wall of cell_size x
+    # cell_size pixels becomes a single rectangle instead of one per pixel
+    # or per cell. The rectangles do not overlap and cover the grid exactly.
+    grid = np.asarray(grid, dtype=np.bool_)
+    height, width = grid.shape
+    edges = np.diff(np.pad(grid, ((0, 0), (1, 1))).view(np.int8), axis=1)
+    start_y, start_x = np.nonzero(edges == 1)
+    end_y, end_x = np.nonzero(edges == -1)
+    if not len(start_x):
+        return np.empty((0, 4), dtype=np.int32)
+    # Both scans are row-major, so the k-th start and end belong to the
+    # same run. Sorting the runs by extent, then row, puts every stack of
+    # identical runs next to each other.
+    order = np.lexsort((start_y, end_x, start_x))
+    y, x0, x1 = start_y[order], start_x[order], end_x[order]
+    new = np.ones(len(y), dtype=np.bool_)
+    new[1:] = (x0[1:] != x0[:-1]) | (x1[1:] != x1[:-1]) | (y[1:] != y[:-1] + 1)
+    first = np.flatnonzero(new)
+    last = np.append(first[1:], len(y)) - 1
+    rects = np.stack([x0[first], y[first], x1[first] - x0[first], y[last] - y[first] + 1], axis=1)
+    return rects.astype(np.int32)
+